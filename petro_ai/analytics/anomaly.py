@@ -0,0 +1,349 @@
+# analytics/anomaly.py
+"""
+Streaming anomaly detection for price ticks and sensor readings.
+
+Every series (a commodity price or one metric of one asset) keeps a fixed
+amount of state in flat NumPy arrays, so each sample costs O(1) and a
+batch of samples is checked with vectorised operations across series:
+
+- robust z-score against a streaming median / MAD estimate
+- EWMA control limits
+- rate of change versus the previous sample
+
+Alerts and decayed per-asset anomaly scores are published to ALERTS_FILE
+for the dashboard and the maintenance scoring. Several processes publish
+alerts (the MQTT client, history replays), so every publish merges into the
+file instead of replacing it.
+"""
+import math
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from .reorder import parse_timestamp
+from .storage import file_lock, write_json, read_json
+
+ALERTS_FILE = Path("analytics/alerts.json")
+
+# Samples a series needs before it can raise alerts
+WARMUP = 20
+# Robust z-score limit (|x - median| / (1.4826 * MAD))
+ROBUST_Z_LIMIT = 6.0
+# Step size of the streaming median / MAD estimates, relative to the MAD
+QUANTILE_STEP = 0.05
+# EWMA smoothing factor and control limit in standard deviations
+EWMA_ALPHA = 0.05
+EWMA_LIMIT = 5.0
+# Largest accepted relative change between consecutive samples
+ROC_LIMIT = 0.25
+# Flagged samples in a row after which the series is taken to have moved to
+# a new level, which then becomes the rate-of-change reference
+SHIFT_CONFIRM = 3
+
+# Alert scores are multiples of the violated limit, capped at this value
+MAX_ALERT_SCORE = 10.0
+# Per-asset anomaly scores decay with this half-life (seconds)
+SCORE_HALF_LIFE = 3600.0
+# Recent alerts kept for the dashboard
+MAX_ALERTS = 200
+# Minimum seconds between publishes when there are no new alerts
+PUBLISH_INTERVAL = 5.0
+
+_EPS = 1e-9
+
+
+class StreamingDetector:
+    """Per-series detector state stored column-wise in NumPy arrays"""
+
+    def __init__(self, capacity=1024):
+        self.index = {}
+        self.keys = []
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        def grow(name, fill):
+            old = getattr(self, name, None)
+            new = np.full(capacity, fill, dtype=np.float64)
+            if old is not None:
+                new[:len(old)] = old
+            setattr(self, name, new)
+
+        grow('count', 0.0)
+        grow('median', 0.0)
+        grow('mad', 0.0)
+        grow('mean', 0.0)
+        grow('var', 0.0)
+        grow('last', np.nan)
+        grow('streak', 0.0)
+        self.capacity = capacity
+
+    def _rows(self, keys):
+        rows = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            row = self.index.get(key)
+            if row is None:
+                row = len(self.keys)
+                if row >= self.capacity:
+                    self._alloc(self.capacity * 2)
+                self.index[key] = row
+                self.keys.append(key)
+            rows[i] = row
+        return rows
+
+    def update(self, keys, values):
+        """
+        Check and absorb a batch of samples.
+        keys: sequence of series keys, values: matching sequence of floats
+        Returns a list of (position, reasons, score) for flagged samples,
+        where position indexes into the batch.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        rows = self._rows(keys)
+        flagged = []
+
+        # A series may appear several times in one batch; process the batch
+        # in rounds that touch each series at most once, in arrival order.
+        # Round r holds the r-th sample of every series.
+        if not len(rows):
+            return flagged
+        order = np.argsort(rows, kind='stable')
+        sorted_rows = rows[order]
+        starts = np.flatnonzero(np.r_[True, sorted_rows[1:] != sorted_rows[:-1]])
+        sizes = np.diff(np.r_[starts, len(rows)])
+        rank = np.empty(len(rows), dtype=np.int64)
+        rank[order] = np.arange(len(rows)) - np.repeat(starts, sizes)
+        by_rank = np.argsort(rank, kind='stable')
+        bounds = np.searchsorted(rank[by_rank], np.arange(sizes.max() + 1))
+        for r in range(sizes.max()):
+            take = by_rank[bounds[r]:bounds[r + 1]]
+            flagged.extend(self._step(take, rows[take], values[take]))
+        flagged.sort(key=lambda f: f[0])
+        return flagged
+
+    def _step(self, positions, rows, x):
+        valid = np.isfinite(x)
+        positions, rows, x = positions[valid], rows[valid], x[valid]
+        if not len(rows):
+            return []
+
+        count = self.count[rows]
+        median = self.median[rows]
+        mad = self.mad[rows]
+        mean = self.mean[rows]
+        var = self.var[rows]
+        last = self.last[rows]
+
+        fresh = count == 0
+        median = np.where(fresh, x, median)
+        mean = np.where(fresh, x, mean)
+        scale = np.maximum(mad, np.abs(median) * 1e-3 + _EPS)
+
+        # Checks against the state before this sample
+        robust_z = np.abs(x - median) / (1.4826 * scale)
+        ewma_z = np.abs(x - mean) / np.sqrt(var + _EPS)
+        # Near zero the relative change is measured against the noise level,
+        # so a stopped pump reading 0 +/- noise is not flagged on every sample
+        roc = np.abs(x - last) / np.maximum(
+            np.abs(last), 1.4826 * scale * ROBUST_Z_LIMIT / ROC_LIMIT)
+        armed = count >= WARMUP
+        robust_hit = armed & (robust_z > ROBUST_Z_LIMIT)
+        ewma_hit = armed & (ewma_z > EWMA_LIMIT)
+        roc_hit = armed & np.isfinite(last) & (roc > ROC_LIMIT)
+
+        # Streaming median / MAD: running means while warming up, then
+        # frugal quantile steps scaled by the current MAD
+        dev = x - median
+        warm = count < WARMUP
+        median = np.where(
+            warm, median + dev / (count + 1),
+            median + QUANTILE_STEP * scale * np.sign(dev),
+        )
+        mad = np.where(
+            warm, mad + (np.abs(dev) - mad) / np.maximum(count, 1),
+            mad + QUANTILE_STEP * scale * np.sign(np.abs(dev) - mad),
+        )
+
+        # EWMA with the sample clipped to the control limit so a single
+        # spike does not blow up the variance
+        limit = EWMA_LIMIT * np.sqrt(var + _EPS)
+        clipped = np.where(armed, np.clip(x, mean - limit, mean + limit), x)
+        delta = clipped - mean
+        mean = mean + EWMA_ALPHA * delta
+        var = (1 - EWMA_ALPHA) * (var + EWMA_ALPHA * delta * delta)
+
+        self.count[rows] = count + 1
+        self.median[rows] = median
+        self.mad[rows] = np.maximum(mad, 0.0)
+        self.mean[rows] = mean
+        self.var[rows] = var
+        # An isolated flagged sample does not become the rate-of-change
+        # reference, so the return to normal after a spike is not reported
+        # again; a run of SHIFT_CONFIRM flagged samples is a level shift
+        hits = robust_hit | ewma_hit | roc_hit
+        streak = np.where(hits, self.streak[rows] + 1, 0)
+        self.streak[rows] = streak
+        self.last[rows] = np.where(hits & (streak < SHIFT_CONFIRM), last, x)
+
+        flagged = []
+        for i in np.flatnonzero(hits):
+            reasons = []
+            if robust_hit[i]:
+                reasons.append('robust_z')
+            if ewma_hit[i]:
+                reasons.append('ewma')
+            if roc_hit[i]:
+                reasons.append('rate_of_change')
+            score = float(max(robust_z[i] / ROBUST_Z_LIMIT, ewma_z[i] / EWMA_LIMIT,
+                              roc[i] / ROC_LIMIT if np.isfinite(roc[i]) else 0.0))
+            flagged.append((int(positions[i]), reasons, round(min(score, MAX_ALERT_SCORE), 2)))
+        return flagged
+
+
+def _decay(seconds):
+    return 0.5 ** (max(seconds, 0.0) / SCORE_HALF_LIFE)
+
+
+def _epoch(date, default):
+    """Epoch seconds of an alert or file date, or default when it does not parse"""
+    ts = parse_timestamp(date)
+    return ts.timestamp() if ts is not None else default
+
+
+class AlertPublisher:
+    """
+    Recent alerts plus exponentially decayed anomaly scores per asset.
+    New alerts are held until the next publish, which merges them into the
+    published file under a lock shared by all processes. Scores decay from
+    each alert's event date, so replayed history barely moves them.
+    """
+
+    def __init__(self, path=ALERTS_FILE):
+        self.path = path
+        self.lock_file = path.with_name(f".{path.name}.lock")
+        self.pending = []
+        self.published_at = 0.0
+
+    def add(self, alerts):
+        self.pending.extend(alerts)
+
+    def publish(self, force=False, now=None):
+        now = time.time() if now is None else now
+        if not (force or self.pending or now - self.published_at >= PUBLISH_INTERVAL):
+            return
+        with file_lock(self.lock_file):
+            data = read_json(self.path, {'alerts': [], 'asset_scores': {}})
+            stamp = min(_epoch(data.get('updated_at'), now), now)
+            scores = {asset: (score, stamp) for asset, score in data['asset_scores'].items()}
+            for alert in self.pending:
+                when = min(_epoch(alert['date'], now), now)
+                score, last = scores.get(alert['asset'], (0.0, when))
+                latest = max(last, when)
+                scores[alert['asset']] = (
+                    score * _decay(latest - last) + alert['score'] * _decay(latest - when),
+                    latest,
+                )
+            # Newest events first; among equal dates the new alerts lead
+            alerts = self.pending[::-1] + data['alerts']
+            alerts.sort(key=lambda a: _epoch(a['date'], 0.0), reverse=True)
+            write_json(self.path, {
+                'alerts': alerts[:MAX_ALERTS],
+                'asset_scores': {
+                    asset: round(score * _decay(now - last), 3)
+                    for asset, (score, last) in scores.items()
+                },
+                'updated_at': datetime.fromtimestamp(now).isoformat(),
+            })
+        self.published_at = now
+        self.pending = []
+
+
+# -------------------------------
+# Ingest hooks and readers
+# -------------------------------
+_detector = StreamingDetector()
+_publisher = AlertPublisher()
+_lock = threading.Lock()
+
+
+def detect(detector, samples):
+    """
+    Run a batch of samples through a detector.
+    samples: list of (asset, metric, date, value); prices use the asset
+    name "market" and the commodity as metric
+    Returns alert dicts for the flagged samples.
+    """
+    if not samples:
+        return []
+    keys = [(asset, metric) for asset, metric, _, _ in samples]
+    values = [value for _, _, _, value in samples]
+    alerts = []
+    for pos, reasons, score in detector.update(keys, values):
+        asset, metric, date, value = samples[pos]
+        alerts.append({
+            'asset': asset,
+            'metric': metric,
+            'date': str(date),
+            'value': value,
+            'checks': reasons,
+            'score': score,
+        })
+    return alerts
+
+
+def check_samples(samples):
+    """Check a batch of samples with the shared detector and publish any alerts"""
+    if not samples:
+        return []
+    with _lock:
+        alerts = detect(_detector, samples)
+        _publisher.add(alerts)
+        _publisher.publish()
+    return alerts
+
+
+def record_alerts(alerts):
+    """Publish alerts raised by detectors in other processes"""
+    with _lock:
+        _publisher.add(alerts)
+        _publisher.publish(force=True)
+
+
+def to_number(value):
+    """Float value of a payload field, or None when it is missing or not a finite number"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def price_samples(payload, columns):
+    """Samples for one price tick, skipping non-numeric values"""
+    date = payload.get('Date')
+    values = [(col, to_number(payload.get(col))) for col in columns]
+    return [('market', col, date, value) for col, value in values if value is not None]
+
+
+def sensor_samples(payload, metrics):
+    """Samples for one asset sensor reading, skipping non-numeric values"""
+    asset, date = payload.get('Asset'), payload.get('Date')
+    values = [(m, to_number(payload.get(m))) for m in metrics]
+    return [(asset, m, date, value) for m, value in values if value is not None]
+
+
+_cache = {'mtime': None, 'data': None}
+
+
+def load_alerts(path=ALERTS_FILE):
+    """Latest published alerts and asset scores, re-read only when changed"""
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return {'alerts': [], 'asset_scores': {}}
+    if _cache['mtime'] != mtime:
+        _cache['data'] = read_json(path, {'alerts': [], 'asset_scores': {}})
+        _cache['mtime'] = mtime
+    return _cache['data']
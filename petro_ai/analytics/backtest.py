@@ -0,0 +1,313 @@
+# analytics/backtest.py
+"""
+Rolling-origin backtesting of the price forecasting models.
+
+Each series is cut at a sequence of forecast origins; every model is fitted
+on the history before an origin and scored on the next `horizon` points
+(MAE, MAPE and prediction interval coverage). Folds run in a process pool,
+and every fitted fold is cached on disk under a key derived from the model,
+its settings and the training data, so a re-run after new data arrives only
+fits the new folds.
+
+The report puts accuracy next to fit time, to pick the cheapest model that
+is accurate enough for the refresh rate.
+"""
+import hashlib
+import importlib.util
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from .storage import load_tiered, read_json, write_json
+
+BACKTEST_DIR = Path("analytics/backtests")
+CACHE_DIR = BACKTEST_DIR / "cache"
+REPORT_FILE = BACKTEST_DIR / "report.json"
+
+PRICE_SERIES = ['Brent', 'WTI', 'NaturalGas']
+
+# run_forecast_prophet forecasts 10 days ahead
+DEFAULT_HORIZON = 10
+DEFAULT_INITIAL = 60
+DEFAULT_STEP = 5
+DEFAULT_MAX_FOLDS = 20
+DEFAULT_SEASON = 7
+DEFAULT_RESOLUTION = '1D'
+# Prophet's default interval width
+DEFAULT_LEVEL = 0.8
+
+# A model is good enough when its MAPE is within this factor of the best one
+GOOD_ENOUGH = 1.1
+
+# Smoothing factors searched by the exponential smoothing baseline
+SES_ALPHAS = np.linspace(0.05, 1.0, 20)
+
+
+# -------------------------------
+# Models
+# -------------------------------
+# Every model takes the training dates and values and returns the point
+# forecast and the lower/upper interval bounds for the next horizon points.
+def _z(level):
+    return NormalDist().inv_cdf((1 + level) / 2)
+
+
+def naive(dates, y, horizon, level, season, freq):
+    """Last value, with a random-walk interval"""
+    sigma = np.std(np.diff(y), ddof=1) if len(y) > 2 else 0.0
+    yhat = np.full(horizon, y[-1])
+    width = _z(level) * sigma * np.sqrt(np.arange(1, horizon + 1))
+    return yhat, yhat - width, yhat + width
+
+
+def seasonal_naive(dates, y, horizon, level, season, freq):
+    """Value one season earlier"""
+    if len(y) <= season + 1:
+        return naive(dates, y, horizon, level, season, freq)
+    steps = np.arange(horizon)
+    yhat = y[len(y) - season + steps % season]
+    sigma = np.std(y[season:] - y[:-season], ddof=1)
+    width = _z(level) * sigma * np.sqrt(steps // season + 1)
+    return yhat, yhat - width, yhat + width
+
+
+def exp_smoothing(dates, y, horizon, level, season, freq):
+    """Simple exponential smoothing, alpha chosen by one-step squared error"""
+    # One pass over the series updates the whole alpha grid at once
+    smoothed = np.full(len(SES_ALPHAS), y[0], dtype=np.float64)
+    sse = np.zeros(len(SES_ALPHAS))
+    for value in y[1:]:
+        error = value - smoothed
+        sse += error * error
+        smoothed += SES_ALPHAS * error
+    best = int(np.argmin(sse))
+    alpha = SES_ALPHAS[best]
+    sigma = np.sqrt(sse[best] / max(len(y) - 1, 1))
+    yhat = np.full(horizon, smoothed[best])
+    width = _z(level) * sigma * np.sqrt(1 + alpha ** 2 * np.arange(horizon))
+    return yhat, yhat - width, yhat + width
+
+
+def prophet(dates, y, horizon, level, season, freq):
+    """Prophet with the settings of run_forecast_prophet"""
+    # Imported here: Prophet is optional and slow to import
+    from prophet import Prophet
+
+    m = Prophet(daily_seasonality=True, interval_width=level)
+    m.fit(pd.DataFrame({'ds': dates, 'y': y}))
+    future = m.make_future_dataframe(periods=horizon, freq=freq, include_history=False)
+    forecast = m.predict(future)
+    return (
+        forecast['yhat'].to_numpy(),
+        forecast['yhat_lower'].to_numpy(),
+        forecast['yhat_upper'].to_numpy(),
+    )
+
+
+MODELS = {
+    'naive': naive,
+    'seasonal_naive': seasonal_naive,
+    'exp_smoothing': exp_smoothing,
+    'prophet': prophet,
+}
+
+# Packages a model needs beyond NumPy and pandas
+MODEL_REQUIREMENTS = {'prophet': 'prophet'}
+
+
+def missing_requirement(model):
+    """Name of the missing package a model needs, or None"""
+    package = MODEL_REQUIREMENTS.get(model)
+    if package and importlib.util.find_spec(package) is None:
+        return package
+    return None
+
+
+# -------------------------------
+# Folds
+# -------------------------------
+def load_series(columns=None, resolution=DEFAULT_RESOLUTION):
+    """{column: (dates, values)} of the price history at the given resolution"""
+    columns = columns or PRICE_SERIES
+    df = load_tiered('prices', columns, tier='rollup')
+    if df.empty:
+        return {}
+    df = df.set_index('Date').resample(resolution).mean()
+    series = {}
+    for col in columns:
+        if col in df.columns:
+            values = df[col].dropna()
+            series[col] = (values.index.to_numpy(), values.to_numpy(np.float64))
+    return series
+
+
+def fold_origins(n, horizon, initial, step, max_folds):
+    """Training sizes of the folds, keeping the most recent max_folds"""
+    origins = list(range(initial, n - horizon + 1, step))
+    return origins[-max_folds:] if max_folds else origins
+
+
+def _fold_keys(model, dates, values, origins, settings):
+    """
+    Cache keys of a model's folds on one series. The training data is hashed
+    incrementally, so keys for all folds cost one pass over the series.
+    """
+    digest = hashlib.sha1(repr((model, settings)).encode())
+    keys, done = [], 0
+    for origin in origins:
+        digest.update(values[done:origin].tobytes())
+        digest.update(dates[done:origin].astype('datetime64[ns]').tobytes())
+        done = origin
+        keys.append(digest.copy().hexdigest())
+    return keys
+
+
+_worker_series = {}
+
+
+def _init_worker(series):
+    _worker_series.update(series)
+
+
+def _fit_fold(task):
+    """Fit one model on one fold; runs in a worker process"""
+    model, column, origin, horizon, level, season, freq = task
+    dates, values = _worker_series[column]
+    start = time.perf_counter()
+    yhat, lower, upper = MODELS[model](dates[:origin], values[:origin], horizon, level, season, freq)
+    return {
+        'yhat': np.asarray(yhat, dtype=np.float64).tolist(),
+        'lower': np.asarray(lower, dtype=np.float64).tolist(),
+        'upper': np.asarray(upper, dtype=np.float64).tolist(),
+        'fit_seconds': time.perf_counter() - start,
+    }
+
+
+def _score(fits, actuals):
+    """Pooled MAE, MAPE (%) and coverage over the points of all folds"""
+    yhat = np.concatenate([f['yhat'] for f in fits])
+    lower = np.concatenate([f['lower'] for f in fits])
+    upper = np.concatenate([f['upper'] for f in fits])
+    actual = np.concatenate(actuals)
+    error = np.abs(actual - yhat)
+    nonzero = actual != 0
+    return {
+        'mae': float(error.mean()),
+        'mape': float((error[nonzero] / np.abs(actual[nonzero])).mean() * 100) if nonzero.any() else None,
+        'coverage': float(((actual >= lower) & (actual <= upper)).mean()),
+        'points': int(len(actual)),
+    }
+
+
+def run_backtest(models=None, columns=None, horizon=DEFAULT_HORIZON, initial=DEFAULT_INITIAL,
+                 step=DEFAULT_STEP, max_folds=DEFAULT_MAX_FOLDS, level=DEFAULT_LEVEL,
+                 season=DEFAULT_SEASON, resolution=DEFAULT_RESOLUTION, workers=None,
+                 use_cache=True, series=None):
+    """
+    Rolling-origin evaluation of every model on every series.
+    series: {column: (dates, values)}, loaded with load_series by default
+    Returns the report dict, also written to REPORT_FILE.
+    """
+    models = models or list(MODELS)
+    series = load_series(columns, resolution) if series is None else series
+    settings = (horizon, level, season, resolution)
+
+    skipped = {}
+    for model in models:
+        if model not in MODELS:
+            raise ValueError(f'unknown model: {model}')
+        package = missing_requirement(model)
+        if package:
+            skipped[model] = f'{package} is not installed'
+    models = [m for m in models if m not in skipped]
+
+    # Plan the folds and split them into cache hits and fits to run
+    folds = {}
+    tasks, task_keys = [], []
+    for column, (dates, values) in series.items():
+        origins = fold_origins(len(values), horizon, initial, step, max_folds)
+        for model in models:
+            keys = _fold_keys(model, dates, values, origins, settings)
+            folds[(model, column)] = list(zip(origins, keys))
+            for origin, key in zip(origins, keys):
+                if not (use_cache and (CACHE_DIR / f'{key}.json').exists()):
+                    tasks.append((model, column, origin, horizon, level, season, resolution))
+                    task_keys.append(key)
+
+    started = time.perf_counter()
+    if tasks:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        workers = workers or os.cpu_count() or 1
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(series,)) as pool:
+                results = pool.map(_fit_fold, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+                for key, result in zip(task_keys, results):
+                    write_json(CACHE_DIR / f'{key}.json', result)
+        else:
+            _init_worker(series)
+            for key, task in zip(task_keys, tasks):
+                write_json(CACHE_DIR / f'{key}.json', _fit_fold(task))
+    wall_seconds = time.perf_counter() - started
+
+    fitted = set(task_keys)
+    rows = []
+    for (model, column), model_folds in folds.items():
+        values = series[column][1]
+        fits = [read_json(CACHE_DIR / f'{key}.json') for _, key in model_folds]
+        actuals = [values[origin:origin + horizon] for origin, _ in model_folds]
+        fit_seconds = [f['fit_seconds'] for f in fits]
+        rows.append({
+            'model': model,
+            'series': column,
+            'folds': len(fits),
+            'cached': sum(key not in fitted for _, key in model_folds),
+            'fit_seconds': float(np.mean(fit_seconds)) if fits else None,
+            **(_score(fits, actuals) if fits else {'mae': None, 'mape': None, 'coverage': None, 'points': 0}),
+        })
+
+    summary = []
+    for model in models:
+        model_rows = [r for r in rows if r['model'] == model and r['folds']]
+        if not model_rows:
+            continue
+        weights = np.array([r['points'] for r in model_rows], dtype=np.float64)
+        mapes = [r['mape'] for r in model_rows]
+        summary.append({
+            'model': model,
+            'folds': sum(r['folds'] for r in model_rows),
+            'mape': float(np.average(mapes, weights=weights)) if None not in mapes else None,
+            'coverage': float(np.average([r['coverage'] for r in model_rows], weights=weights)),
+            'fit_seconds': float(np.average([r['fit_seconds'] for r in model_rows], weights=[r['folds'] for r in model_rows])),
+        })
+    summary.sort(key=lambda r: r['fit_seconds'])
+
+    report = {
+        'settings': {
+            'horizon': horizon, 'initial': initial, 'step': step, 'max_folds': max_folds,
+            'level': level, 'season': season, 'resolution': resolution,
+        },
+        'models': summary,
+        'series': rows,
+        'recommended': recommend(summary),
+        'skipped': skipped,
+        'fitted_folds': len(tasks),
+        'wall_seconds': wall_seconds,
+    }
+    BACKTEST_DIR.mkdir(parents=True, exist_ok=True)
+    write_json(REPORT_FILE, report)
+    return report
+
+
+def recommend(summary, tolerance=GOOD_ENOUGH):
+    """Cheapest model whose MAPE is within tolerance of the best MAPE"""
+    scored = [r for r in summary if r['mape'] is not None]
+    if not scored:
+        return None
+    best = min(r['mape'] for r in scored)
+    good = [r for r in scored if r['mape'] <= best * tolerance]
+    return min(good, key=lambda r: r['fit_seconds'])['model']
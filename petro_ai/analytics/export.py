@@ -0,0 +1,169 @@
+# analytics/export.py
+"""
+Chunked export of the stored price and sensor history.
+
+Rows are read one Parquet batch at a time, optionally downsampled, encoded
+as CSV, NDJSON or Parquet and compressed on the fly, so memory use stays
+bounded by the batch size regardless of how much history is exported.
+"""
+import io
+import zlib
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .ingest import FIELDS
+from .storage import TEXT_COLUMNS, iter_tiered
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+# Compression codecs accepted per format; Parquet codecs missing from the
+# installed pyarrow build are left out
+COMPRESSIONS = {
+    'csv': {'gzip'},
+    'ndjson': {'gzip'},
+    'parquet': {c for c in ('zstd', 'snappy', 'gzip') if pa.Codec.is_available(c)},
+}
+
+# Rows read from the history per chunk
+EXPORT_BATCH_ROWS = 20_000
+
+
+def _resample(batches, resolution, group_by):
+    """
+    Downsample sorted batches to bucket means. The last bucket of each batch
+    may continue in the next one, so its partial sums and counts are carried
+    over until it is closed.
+    """
+    keys = ['Date'] + group_by
+    carry = None
+    for batch in batches:
+        df = batch.to_pandas()
+        df['Date'] = df['Date'].dt.floor(resolution)
+        grouped = df.groupby(keys)
+        sums = grouped.sum(numeric_only=True)
+        counts = grouped[list(sums.columns)].count()
+        if carry is not None:
+            sums = sums.add(carry[0], fill_value=0).sort_index()
+            counts = counts.add(carry[1], fill_value=0).sort_index()
+
+        dates = sums.index.get_level_values('Date')
+        is_open = dates == dates.max()
+        carry = (sums[is_open], counts[is_open])
+        if not is_open.all():
+            yield (sums[~is_open] / counts[~is_open]).reset_index()
+    if carry is not None:
+        yield (carry[0] / carry[1]).reset_index()
+
+
+def iter_frames(dataset='prices', columns=None, start=None, end=None,
+                resolution=None, skip_rows=0):
+    """Yield the requested history as DataFrames of at most one batch each"""
+    group_by = ['Asset'] if dataset == 'sensors' else []
+    if columns is not None:
+        columns = group_by + [c for c in columns if c not in group_by]
+
+    if resolution:
+        # Resampled output is resumed by skipping rows after aggregation
+        batches = iter_tiered(dataset, columns, start, end, 'archive', EXPORT_BATCH_ROWS)
+        for df in _resample(batches, resolution, group_by):
+            if skip_rows >= len(df):
+                skip_rows -= len(df)
+                continue
+            yield df.iloc[skip_rows:]
+            skip_rows = 0
+    else:
+        for batch in iter_tiered(dataset, columns, start, end, 'archive', EXPORT_BATCH_ROWS, skip_rows):
+            yield batch.to_pandas()
+
+
+def empty_schema(dataset='prices', columns=None):
+    """Arrow schema of the requested columns, used when no rows match"""
+    names = [c for c in FIELDS[dataset] if columns is None or c == 'Date' or c in columns
+             or (dataset == 'sensors' and c == 'Asset')]
+    return pa.schema([
+        pa.field(name, pa.timestamp('us') if name == 'Date'
+                 else pa.string() if name in TEXT_COLUMNS else pa.float64())
+        for name in names
+    ])
+
+
+class _ChunkSink(io.RawIOBase):
+    """Writable file object whose contents are drained after every write"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _encode(frames, fmt, compression, schema=None):
+    if fmt == 'csv':
+        header = True
+        for df in frames:
+            yield df.to_csv(index=False, header=header, date_format='%Y-%m-%d %H:%M:%S.%f').encode()
+            header = False
+    elif fmt == 'ndjson':
+        for df in frames:
+            yield df.to_json(orient='records', lines=True, date_format='iso').encode()
+    else:
+        sink = _ChunkSink()
+        writer = None
+        for df in frames:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(sink, table.schema, compression=compression or 'none')
+            writer.write_table(table.cast(writer.schema))
+            yield sink.drain()
+        if writer is None:
+            # Still a valid Parquet file when no rows matched
+            writer = pq.ParquetWriter(sink, schema or pa.schema([]), compression=compression or 'none')
+        writer.close()
+        yield sink.drain()
+
+
+def stream_export(frames, fmt='csv', compression=None, schema=None):
+    """
+    Encode frames as chunks of bytes.
+    compression: 'gzip' compresses CSV/NDJSON output as a gzip stream; for
+    Parquet it is the column codec (e.g. 'zstd', 'snappy', 'gzip')
+    schema: Parquet schema written when there are no frames (see empty_schema)
+    """
+    if fmt == 'parquet' or compression is None:
+        for chunk in _encode(frames, fmt, compression, schema):
+            if chunk:
+                yield chunk
+        return
+
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in _encode(frames, fmt, None):
+        data = gz.compress(chunk)
+        if data:
+            yield data
+    yield gz.flush()
+
+
+def export_filename(dataset, fmt, compression=None):
+    name = f"{dataset}_export.{FORMATS[fmt][1]}"
+    if compression == 'gzip' and fmt != 'parquet':
+        name += '.gz'
+    return name
@@ -0,0 +1,358 @@
+# analytics/indicators.py
+"""
+Technical indicators for the commodity price series.
+
+Every indicator is an incremental kernel: it keeps only the tail of the
+series it still needs (the last window of values or the last smoothed
+value) and turns a block of new prices into indicator values with
+vectorised NumPy operations. IndicatorCache keeps one kernel and its output
+per (indicator, window, column), so a dashboard refresh only feeds the rows
+that arrived since the previous refresh instead of rescanning the history.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .storage import CATALOG_FILE
+
+DEFAULT_WINDOWS = {
+    'sma': 20,
+    'ema': 20,
+    'bollinger': 20,
+    'rsi': 14,
+    'atr': 14,
+    'corr': 30,
+}
+MIN_WINDOW = 2
+MAX_WINDOW = 500
+
+# Indicators drawn on the price axis; the others get their own chart panel
+PRICE_OVERLAYS = {'sma', 'ema', 'bollinger'}
+PANEL_TITLES = {'rsi': 'RSI', 'atr': 'Volatility ($)', 'corr': 'Brent/WTI Corr.'}
+
+BOLLINGER_WIDTH = 2.0
+CORRELATION_PAIR = ('Brent', 'WTI')
+
+# (indicator, window, columns) entries kept in the cache
+MAX_CACHE_ENTRIES = 64
+
+_EPS = 1e-12
+
+
+def parse_indicators(text):
+    """
+    Parse "sma:20,ema:50,rsi" into [('sma', 20), ('ema', 50), ('rsi', 14)].
+    Raises ValueError on unknown indicators or invalid windows.
+    """
+    specs = []
+    for item in (text or '').split(','):
+        item = item.strip().lower()
+        if not item:
+            continue
+        name, _, window = item.partition(':')
+        if name not in DEFAULT_WINDOWS:
+            raise ValueError(f'unknown indicator: {name}')
+        window = int(window) if window else DEFAULT_WINDOWS[name]
+        if not MIN_WINDOW <= window <= MAX_WINDOW:
+            raise ValueError(f'window must be between {MIN_WINDOW} and {MAX_WINDOW}')
+        if (name, window) not in specs:
+            specs.append((name, window))
+    return specs
+
+
+# -------------------------------
+# Kernels
+# -------------------------------
+def _tail(old, new, size):
+    """Last size values of old followed by new"""
+    if size <= 0:
+        return np.empty(0)
+    return np.concatenate([old, new])[-size:]
+
+
+def _rolling_sums(tail, new, window):
+    """
+    Sums over the windows ending at each new value, where tail holds the
+    values preceding new. Returns (sums, counts).
+    """
+    values = np.concatenate([tail, new])
+    csum = np.concatenate([[0.0], np.cumsum(values)])
+    end = np.arange(len(tail) + 1, len(values) + 1)
+    start = np.maximum(end - window, 0)
+    return csum[end] - csum[start], end - start
+
+
+def _smooth(new, alpha, seed):
+    """Exponential smoothing of new, continuing from seed (None to start)"""
+    values = new if seed is None else np.concatenate([[seed], new])
+    out = pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    return out if seed is None else out[1:]
+
+
+class SMA:
+    def __init__(self, window):
+        self.window = window
+        self.tail = np.empty(0)
+
+    def update(self, x):
+        sums, counts = _rolling_sums(self.tail, x, self.window)
+        self.tail = _tail(self.tail, x, self.window - 1)
+        return {'SMA': np.where(counts == self.window, sums / self.window, np.nan)}
+
+
+class EMA:
+    def __init__(self, window):
+        self.window = window
+        self.alpha = 2.0 / (window + 1)
+        self.last = None
+        self.seen = 0
+
+    def update(self, x):
+        ema = _smooth(x, self.alpha, self.last)
+        self.last = ema[-1]
+        # Values before the first full window are dominated by the seed
+        seen = self.seen + np.arange(1, len(x) + 1)
+        self.seen += len(x)
+        return {'EMA': np.where(seen >= self.window, ema, np.nan)}
+
+
+class Bollinger:
+    def __init__(self, window, width=BOLLINGER_WIDTH):
+        self.window = window
+        self.width = width
+        self.tail = np.empty(0)
+
+    def update(self, x):
+        sums, counts = _rolling_sums(self.tail, x, self.window)
+        squares, _ = _rolling_sums(self.tail ** 2, x ** 2, self.window)
+        self.tail = _tail(self.tail, x, self.window - 1)
+        full = counts == self.window
+        mean = np.where(full, sums / self.window, np.nan)
+        std = np.sqrt(np.maximum(squares / self.window - mean ** 2, 0.0))
+        return {
+            'BB mid': mean,
+            'BB upper': mean + self.width * std,
+            'BB lower': mean - self.width * std,
+        }
+
+
+class _Wilder:
+    """Base for indicators smoothing price changes with Wilder's average"""
+
+    def __init__(self, window):
+        self.window = window
+        self.alpha = 1.0 / window
+        self.prev = None
+        self.seen = 0
+
+    def _changes(self, x):
+        prev = x[0] if self.prev is None else self.prev
+        changes = np.diff(x, prepend=prev)
+        # The first value of the series has no change
+        if self.prev is None:
+            changes = changes[1:]
+        self.prev = x[-1]
+        return changes
+
+    def _mask(self, n_values, out):
+        # out covers the changes; the first value of a series has none
+        seen = self.seen + np.arange(1, n_values + 1)
+        self.seen += n_values
+        if len(out) < n_values:
+            out = np.concatenate([[np.nan], out])
+        return np.where(seen > self.window, out, np.nan)
+
+
+class RSI(_Wilder):
+    def __init__(self, window):
+        super().__init__(window)
+        self.gain = None
+        self.loss = None
+
+    def update(self, x):
+        changes = self._changes(x)
+        rsi = np.empty(0)
+        if len(changes):
+            gain = _smooth(np.maximum(changes, 0.0), self.alpha, self.gain)
+            loss = _smooth(np.maximum(-changes, 0.0), self.alpha, self.loss)
+            self.gain, self.loss = gain[-1], loss[-1]
+            rsi = 100.0 - 100.0 / (1.0 + gain / np.maximum(loss, _EPS))
+        return {'RSI': self._mask(len(x), rsi)}
+
+
+class ATR(_Wilder):
+    """Average true range, with close-to-close moves as the true range"""
+
+    def __init__(self, window):
+        super().__init__(window)
+        self.atr = None
+
+    def update(self, x):
+        changes = self._changes(x)
+        atr = np.empty(0)
+        if len(changes):
+            atr = _smooth(np.abs(changes), self.alpha, self.atr)
+            self.atr = atr[-1]
+        return {'ATR': self._mask(len(x), atr)}
+
+
+class Correlation:
+    """Rolling Pearson correlation of two series"""
+
+    def __init__(self, window):
+        self.window = window
+        self.tail = np.empty((0, 2))
+
+    def update(self, x, y):
+        tx, ty = self.tail[:, 0], self.tail[:, 1]
+        sx, counts = _rolling_sums(tx, x, self.window)
+        sy, _ = _rolling_sums(ty, y, self.window)
+        sxx, _ = _rolling_sums(tx * tx, x * x, self.window)
+        syy, _ = _rolling_sums(ty * ty, y * y, self.window)
+        sxy, _ = _rolling_sums(tx * ty, x * y, self.window)
+        self.tail = np.concatenate([self.tail, np.column_stack([x, y])])[-(self.window - 1):]
+
+        n = self.window
+        cov = sxy / n - (sx / n) * (sy / n)
+        var_x = np.maximum(sxx / n - (sx / n) ** 2, 0.0)
+        var_y = np.maximum(syy / n - (sy / n) ** 2, 0.0)
+        corr = np.clip(cov / np.sqrt(var_x * var_y + _EPS), -1.0, 1.0)
+        return {'Corr': np.where(counts == self.window, corr, np.nan)}
+
+
+KERNELS = {
+    'sma': SMA,
+    'ema': EMA,
+    'bollinger': Bollinger,
+    'rsi': RSI,
+    'atr': ATR,
+    'corr': Correlation,
+}
+
+
+# -------------------------------
+# Cache
+# -------------------------------
+class _Buffer:
+    """Append-only array with amortised O(1) appends"""
+
+    def __init__(self, dtype):
+        self.data = np.empty(1024, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        need = self.size + len(values)
+        if need > len(self.data):
+            grown = np.empty(max(need, 2 * len(self.data)), dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:need] = values
+        self.size = need
+
+    def view(self):
+        return self.data[:self.size]
+
+
+class _Entry:
+    def __init__(self, kernel, generation):
+        self.kernel = kernel
+        self.generation = generation
+        self.dates = _Buffer('datetime64[ns]')
+        self.outputs = {}
+
+    def append(self, dates, outputs):
+        self.dates.extend(dates)
+        for label, values in outputs.items():
+            self.outputs.setdefault(label, _Buffer(np.float64)).extend(values)
+
+
+class IndicatorCache:
+    """
+    Indicator output per (indicator, window, columns), extended with the
+    rows that are newer than the cached ones. An entry is rebuilt when the
+    requested history starts before it, or when compaction has rewritten the
+    history (generation changes).
+    """
+
+    def __init__(self, max_entries=MAX_CACHE_ENTRIES):
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+    def series(self, name, window, frame, columns, generation=None):
+        """
+        Indicator values for the rows of frame, which holds Date and the
+        input columns without missing values, sorted by Date.
+        Returns {label: array aligned with frame}.
+        """
+        dates = frame['Date'].to_numpy('datetime64[ns]')
+        key = (name, window, tuple(columns))
+        with self.lock:
+            entry = self.entries.get(key)
+            cached = entry.dates.view() if entry is not None else None
+            if (entry is None or entry.generation != generation or not len(cached)
+                    or dates[0] < cached[0]):
+                entry = _Entry(KERNELS[name](window), generation)
+                cached = entry.dates.view()
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+            pos = np.searchsorted(dates, cached[-1], side='right') if len(cached) else 0
+            if pos < len(dates):
+                values = [frame[c].to_numpy(np.float64)[pos:] for c in columns]
+                entry.append(dates[pos:], entry.kernel.update(*values))
+                cached = entry.dates.view()
+
+            lo = np.searchsorted(cached, dates[0], side='left')
+            hi = np.searchsorted(cached, dates[-1], side='right')
+            if hi - lo != len(dates):
+                # The cached rows no longer match the history; start over
+                del self.entries[key]
+                return self.series(name, window, frame, columns, generation)
+            return {label: buf.view()[lo:hi] for label, buf in entry.outputs.items()}
+
+
+_cache = IndicatorCache()
+
+
+def _generation():
+    try:
+        return CATALOG_FILE.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def compute_indicators(df, specs, cache=None):
+    """
+    Compute the requested indicators for every price column of df, which
+    must be sorted by Date as load_tiered returns it.
+    Returns a list of (indicator, label, values) with values aligned to df.
+    """
+    cache = _cache if cache is None else cache
+    if df.empty or not specs:
+        return []
+    generation = _generation()
+    price_columns = [c for c in df.columns if c != 'Date']
+
+    results = []
+    for name, window in specs:
+        if name == 'corr':
+            groups = [list(CORRELATION_PAIR)] if set(CORRELATION_PAIR) <= set(price_columns) else []
+        else:
+            groups = [[c] for c in price_columns]
+        for columns in groups:
+            mask = df[columns].notna().all(axis=1).to_numpy()
+            if not mask.any():
+                continue
+            frame = df.loc[mask, ['Date'] + columns]
+            outputs = cache.series(name, window, frame, columns, generation)
+            subject = '/'.join(columns)
+            for label, values in outputs.items():
+                aligned = np.full(len(df), np.nan)
+                aligned[mask] = values
+                results.append((name, f'{subject} {label}({window})', aligned))
+    return results
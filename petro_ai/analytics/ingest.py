@@ -0,0 +1,72 @@
+# analytics/ingest.py
+"""
+Batch ingest path shared by the MQTT client and the history replay.
+
+A batch of rows in Date order is appended to the dataset's ingest CSV,
+checked for anomalies in one vectorised pass and, for prices, fed to the
+insights engine, which republishes once per batch.
+
+Payloads come from a public broker, so rows are cleaned first: numeric
+fields that do not parse become empty, and sensor rows without a valid
+asset id are dropped.
+"""
+import re
+
+from .anomaly import check_samples, price_samples, sensor_samples, to_number
+from .insights import ingest_ticks
+from .storage import DATASETS, PRICE_COLUMNS, SENSOR_COLUMNS, append_rows
+
+PRICE_FIELDS = ["Date"] + PRICE_COLUMNS
+SENSOR_ROW_FIELDS = ["Date", "Asset"] + SENSOR_COLUMNS
+FIELDS = {'prices': PRICE_FIELDS, 'sensors': SENSOR_ROW_FIELDS}
+
+# Asset ids as the simulator and the maintenance table name them ("Pump-3")
+ASSET_ID_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9 _.-]{0,63}")
+
+
+def valid_asset_id(value):
+    """True for asset ids that are safe to store and display"""
+    return isinstance(value, str) and ASSET_ID_PATTERN.fullmatch(value) is not None
+
+
+def clean_rows(dataset, rows):
+    """Rows restricted to the dataset's fields with numeric values coerced"""
+    numeric = PRICE_COLUMNS if dataset == 'prices' else SENSOR_COLUMNS
+    cleaned = []
+    for row in rows:
+        if dataset == 'sensors' and not valid_asset_id(row.get('Asset')):
+            continue
+        row = {k: row.get(k) for k in FIELDS[dataset]}
+        for col in numeric:
+            row[col] = to_number(row[col])
+        cleaned.append(row)
+    return cleaned
+
+
+def batch_samples(dataset, rows):
+    """Anomaly detector samples for a batch of rows"""
+    if dataset == 'prices':
+        return [s for row in rows for s in price_samples(row, PRICE_COLUMNS)]
+    return [s for row in rows for s in sensor_samples(row, SENSOR_COLUMNS)]
+
+
+def ingest_batch(dataset, rows, check=check_samples, update_insights=True, lock=None):
+    """
+    Write one batch of rows through the ingest path.
+    check: anomaly check run on the batch's samples, returning alerts
+    lock: held while appending when several processes share the ingest CSV
+    Returns the alerts raised by the batch.
+    """
+    rows = clean_rows(dataset, rows)
+    if not rows:
+        return []
+    csv_file = DATASETS[dataset]
+    if lock is None:
+        append_rows(csv_file, FIELDS[dataset], rows)
+    else:
+        with lock:
+            append_rows(csv_file, FIELDS[dataset], rows)
+    alerts = check(batch_samples(dataset, rows))
+    if update_insights and dataset == 'prices':
+        ingest_ticks(rows)
+    return alerts
@@ -0,0 +1,409 @@
+# analytics/insights.py
+"""
+Insights engine: keeps running statistics per price series, updated on
+every ingested tick, and publishes ranked insights to INSIGHTS_FILE so the
+API and the PDF report only have to read the latest results.
+
+Each published file has one writer. The ingest process publishes the market
+insights; the process running the maintenance model publishes its risk
+ranking to RISK_FILE. Readers merge the two.
+
+The engine remembers the generation of the price history it was built
+from. When a bulk load rebuilds the history, the ingest process starts over
+from the rebuilt history on its next tick, and readers ignore published
+insights of an older generation until it has.
+"""
+import math
+import threading
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from .storage import (
+    PRICE_COLUMNS, REALTIME_FILE, history_generation, load_history, read_json, sync_history,
+    write_json,
+)
+
+INSIGHTS_FILE = Path("analytics/insights.json")
+RISK_FILE = Path("analytics/maintenance_risk.json")
+
+# Window sizes are in ticks
+FAST_SPAN = 5
+SLOW_SPAN = 20
+SHORT_WINDOW = 10
+LONG_WINDOW = 60
+
+# Volatility ratio (short / long) bounds for the regime labels
+HIGH_VOL_RATIO = 1.5
+LOW_VOL_RATIO = 0.6
+# Spread z-score that is worth reporting
+SPREAD_Z_ALERT = 2.0
+
+MAX_INSIGHTS = 8
+TOP_RISK_ASSETS = 3
+
+SERIES_LABELS = {'Brent': 'Brent Crude', 'WTI': 'WTI Crude', 'NaturalGas': 'Natural Gas'}
+
+
+class RollingStats:
+    """Mean and standard deviation over a fixed window in O(1) per update"""
+
+    def __init__(self, window):
+        self.values = deque(maxlen=window)
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def push(self, x):
+        if len(self.values) == self.values.maxlen:
+            old = self.values[0]
+            self.total -= old
+            self.total_sq -= old * old
+        self.values.append(x)
+        self.total += x
+        self.total_sq += x * x
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def mean(self):
+        return self.total / len(self.values) if self.values else 0.0
+
+    @property
+    def std(self):
+        n = len(self.values)
+        if n < 2:
+            return 0.0
+        var = (self.total_sq - self.total * self.total / n) / (n - 1)
+        return math.sqrt(max(var, 0.0))
+
+
+class SeriesState:
+    """Running trend and volatility state for one price series"""
+
+    def __init__(self):
+        self.last = None
+        self.last_date = None
+        self.ticks = 0
+        self.ema_fast = None
+        self.ema_slow = None
+        self.cross = 0
+        self.cross_tick = None
+        self.prices = deque(maxlen=LONG_WINDOW)
+        self.short_returns = RollingStats(SHORT_WINDOW)
+        self.long_returns = RollingStats(LONG_WINDOW)
+        self.regime = 'normal'
+        self.regime_tick = None
+
+    def update(self, date, price):
+        if self.last is not None and self.last > 0 and price > 0:
+            r = math.log(price / self.last)
+            self.short_returns.push(r)
+            self.long_returns.push(r)
+
+        if self.ema_fast is None:
+            self.ema_fast = self.ema_slow = price
+        else:
+            self.ema_fast += (price - self.ema_fast) * 2 / (FAST_SPAN + 1)
+            self.ema_slow += (price - self.ema_slow) * 2 / (SLOW_SPAN + 1)
+
+        # Trend break: fast EMA crossing the slow EMA
+        if self.ticks >= SLOW_SPAN:
+            cross = 1 if self.ema_fast > self.ema_slow else -1
+            if self.cross and cross != self.cross:
+                self.cross_tick = self.ticks
+            self.cross = cross
+
+        # Volatility regime from short vs long realised volatility
+        if len(self.long_returns) >= SHORT_WINDOW * 2 and self.long_returns.std > 0:
+            ratio = self.short_returns.std / self.long_returns.std
+            if ratio >= HIGH_VOL_RATIO:
+                regime = 'high'
+            elif ratio <= LOW_VOL_RATIO:
+                regime = 'low'
+            else:
+                regime = 'normal'
+            if regime != self.regime:
+                self.regime = regime
+                self.regime_tick = self.ticks
+
+        self.prices.append(price)
+        self.last = price
+        self.last_date = date
+        self.ticks += 1
+
+    @property
+    def window_change(self):
+        if len(self.prices) < 2 or self.prices[0] == 0:
+            return 0.0
+        return (self.prices[-1] - self.prices[0]) / self.prices[0] * 100
+
+    def vol_ratio(self):
+        if self.long_returns.std == 0:
+            return 1.0
+        return self.short_returns.std / self.long_returns.std
+
+
+def _priority(score):
+    if score >= 80:
+        return 'critical'
+    if score >= 60:
+        return 'high'
+    return 'medium'
+
+
+def _ranked(found):
+    found.sort(key=lambda i: i['score'], reverse=True)
+    return found[:MAX_INSIGHTS]
+
+
+def _insight(title, content, recommendation, icon, color, score):
+    score = round(min(max(score, 0.0), 100.0), 1)
+    return {
+        'title': title,
+        'content': content,
+        'recommendation': recommendation,
+        'icon': icon,
+        'priority': _priority(score),
+        'color': color,
+        'score': score,
+    }
+
+
+def maintenance_insights(records):
+    """Insights for the assets with the highest predicted failure"""
+    ranked = sorted(records, key=lambda r: r['predicted_failure'], reverse=True)
+    for rank, rec in enumerate(ranked[:TOP_RISK_ASSETS], start=1):
+        prob = rec['predicted_failure']
+        yield _insight(
+            f"Maintenance Risk #{rank}: {rec['asset_id']}",
+            f"{rec['asset_id']} ({rec['metric']}) has a predicted failure "
+            f"probability of {prob:.0%} and health score {rec['health_score']}%.",
+            f"Schedule maintenance for {rec['asset_id']}"
+            + (" within 48 hours" if prob >= 0.2 else " at the next planned window"),
+            'tools', '#E74C3C', prob * 300,
+        )
+
+
+class InsightsEngine:
+    """Incrementally updated market insights"""
+
+    def __init__(self, generation=0):
+        self.generation = generation
+        self.series = {col: SeriesState() for col in PRICE_COLUMNS}
+        self.spread = RollingStats(LONG_WINDOW)
+        self.last_spread = None
+
+    def ingest(self, rows):
+        """
+        Update the running state with new ticks.
+        rows: iterable of dicts or a DataFrame with Date and price columns
+        """
+        if isinstance(rows, pd.DataFrame):
+            rows = rows.to_dict('records')
+        for row in rows:
+            date = row.get('Date')
+            for col, state in self.series.items():
+                value = row.get(col)
+                if value is not None and not pd.isna(value):
+                    state.update(date, float(value))
+            brent, wti = row.get('Brent'), row.get('WTI')
+            if brent is not None and wti is not None and not (pd.isna(brent) or pd.isna(wti)):
+                self.last_spread = float(brent) - float(wti)
+                self.spread.push(self.last_spread)
+
+    # -------------------------------
+    # Insight builders
+    # -------------------------------
+    def _trend_insights(self):
+        for col, state in self.series.items():
+            if state.ticks < SLOW_SPAN:
+                continue
+            label = SERIES_LABELS[col]
+            change = state.window_change
+            direction = 'upward' if state.cross > 0 else 'downward'
+            recent = state.cross_tick is not None and state.ticks - state.cross_tick <= SHORT_WINDOW
+            if recent:
+                score = 60 + min(abs(change) * 5, 35)
+                yield _insight(
+                    f"{label} Trend Break",
+                    f"{label} fast EMA crossed {direction} through the slow EMA "
+                    f"{state.ticks - state.cross_tick} ticks ago at ${state.last:.2f} "
+                    f"({change:+.1f}% over the last {len(state.prices)} ticks).",
+                    f"Review {label} positions after the {direction} trend break",
+                    'chart-line', '#00A8E8', score,
+                )
+            else:
+                yield _insight(
+                    f"{label} Trend",
+                    f"{label} at ${state.last:.2f}, {change:+.1f}% over the last "
+                    f"{len(state.prices)} ticks with a {direction} EMA trend.",
+                    f"Maintain current {label} allocation while the {direction} trend holds",
+                    'chart-line', '#00A8E8', min(abs(change) * 10, 55),
+                )
+
+    def _spread_insight(self):
+        if self.last_spread is None or len(self.spread) < SHORT_WINDOW:
+            return
+        std = self.spread.std
+        z = (self.last_spread - self.spread.mean) / std if std > 0 else 0.0
+        if abs(z) >= SPREAD_Z_ALERT:
+            move = 'widened' if z > 0 else 'narrowed'
+            yield _insight(
+                "Brent-WTI Spread Move",
+                f"Brent-WTI spread {move} to ${self.last_spread:.2f} "
+                f"({z:+.1f} standard deviations from its {len(self.spread)}-tick mean "
+                f"of ${self.spread.mean:.2f}).",
+                f"Re-evaluate Brent/WTI hedges while the spread is {move}",
+                'exchange-alt', '#FF6B35', 50 + min(abs(z) * 10, 45),
+            )
+        else:
+            yield _insight(
+                "Brent-WTI Spread",
+                f"Brent-WTI spread at ${self.last_spread:.2f}, within normal range "
+                f"({z:+.1f} standard deviations).",
+                "No spread action required",
+                'exchange-alt', '#FF6B35', abs(z) * 10,
+            )
+
+    def _volatility_insights(self):
+        for col, state in self.series.items():
+            if state.regime_tick is None:
+                continue
+            label = SERIES_LABELS[col]
+            ratio = state.vol_ratio()
+            if state.regime == 'high':
+                yield _insight(
+                    f"{label} Volatility Spike",
+                    f"{label} short-term volatility is {ratio:.1f}x its long-run level "
+                    f"since {state.ticks - state.regime_tick} ticks ago.",
+                    f"Tighten risk limits on {label} exposure",
+                    'wave-square', '#9C27B0', 55 + min((ratio - 1) * 20, 40),
+                )
+            elif state.regime == 'low':
+                yield _insight(
+                    f"{label} Calm Market",
+                    f"{label} volatility dropped to {ratio:.1f}x its long-run level.",
+                    f"Consider adding {label} storage or hedges at low volatility",
+                    'wave-square', '#9C27B0', 30,
+                )
+
+    def insights(self):
+        """Ranked insight list, highest score first"""
+        found = []
+        found.extend(self._trend_insights())
+        found.extend(self._spread_insight())
+        found.extend(self._volatility_insights())
+        return _ranked(found)
+
+    def report(self):
+        data = {
+            'insights': self.insights(),
+            'generated_at': datetime.now().isoformat(),
+            'generation': self.generation,
+        }
+        data['total_insights'] = len(data['insights'])
+        return data
+
+    def publish(self, path=INSIGHTS_FILE):
+        data = self.report()
+        write_json(path, data)
+        return data
+
+
+# -------------------------------
+# Ingest hooks and readers
+# -------------------------------
+_engine = None
+_engine_lock = threading.Lock()
+_cache = {}
+
+
+def _current_engine():
+    """
+    Process-wide engine, bootstrapped from the stored history and built again
+    when the history is rebuilt. Call with _engine_lock held.
+    Returns (engine, loaded), loaded when it was just built from the history.
+    """
+    global _engine
+    generation = history_generation()
+    if _engine is not None and _engine.generation == generation:
+        return _engine, False
+    _engine = InsightsEngine(generation)
+    if REALTIME_FILE.exists():
+        # Wait for a publish in progress, so ticks already appended to the
+        # ingest CSV are part of the history read
+        sync_history('prices', wait=True)
+        _engine.ingest(load_history())
+    return _engine, True
+
+
+def get_engine():
+    """Process-wide engine, up to date with the stored history's generation"""
+    with _engine_lock:
+        return _current_engine()[0]
+
+
+def ingest_ticks(rows):
+    """
+    Feed newly ingested price ticks to the engine and republish.
+    The ticks must already be appended to the ingest CSV: an engine built
+    from the history here has read them there.
+    """
+    with _engine_lock:
+        engine, loaded = _current_engine()
+        if not loaded:
+            engine.ingest(rows)
+        return engine.publish()
+
+
+def update_maintenance(records, path=RISK_FILE):
+    """
+    Publish the maintenance risk ranking for the insights readers.
+    records: maintenance records as built by analytics.maintenance
+    """
+    ranked = sorted(records, key=lambda r: r['predicted_failure'], reverse=True)
+    data = {
+        'assets': ranked[:TOP_RISK_ASSETS],
+        'generated_at': datetime.now().isoformat(),
+    }
+    write_json(path, data)
+    return data
+
+
+def _read_cached(path):
+    """Published JSON file, re-read only when it changes"""
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    cached = _cache.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = _cache[path] = (mtime, read_json(path))
+    return cached[1]
+
+
+def load_insights(path=INSIGHTS_FILE, risk_path=RISK_FILE):
+    """
+    Latest market insights merged with the latest maintenance risk ranking.
+    Until the ingest process publishes insights of the current history
+    generation, the market insights are computed here from the stored
+    history.
+    """
+    market = _read_cached(path)
+    if market is None or market.get('generation', 0) != history_generation():
+        with _engine_lock:
+            market = _current_engine()[0].report()
+    risk = _read_cached(risk_path)
+    found = list(market['insights'])
+    if risk is not None:
+        found.extend(maintenance_insights(risk['assets']))
+    found = _ranked(found)
+    generated = [market['generated_at']] + ([risk['generated_at']] if risk else [])
+    return {
+        'insights': found,
+        'generated_at': max(generated),
+        'total_insights': len(found),
+    }
@@ -0,0 +1,220 @@
+# analytics/maintenance.py
+"""
+Predictive maintenance snapshot and query API.
+
+A snapshot of plain maintenance records is regenerated at most every
+MAINTENANCE_REFRESH seconds. Each snapshot is pre-sorted once per sort key
+so pages are served with keyset pagination: the cursor holds the
+(sort value, asset id) of the last row of the previous page and the next
+page starts with a binary search instead of an offset scan. A cursor from
+an older snapshot resumes at the same position in the sort order.
+"""
+import base64
+import json
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from .anomaly import load_alerts
+from .ingest import valid_asset_id
+from .insights import update_maintenance
+
+# Demo fleet; assets reporting sensor anomalies are added on top
+DEMO_ASSETS = ['Pump-{}'.format(i) for i in range(1, 11)]
+METRICS = ['Pressure', 'Temperature', 'Vibration', 'Flow Rate', 'Efficiency']
+
+# Failure probability added per unit of decayed anomaly score
+ANOMALY_RISK_WEIGHT = 0.02
+
+# Seconds a snapshot is served before it is regenerated
+MAINTENANCE_REFRESH = 15
+
+STATUSES = ['Critical', 'Warning', 'Optimal']
+STATUS_CLASSES = {'Optimal': 'success', 'Warning': 'warning', 'Critical': 'danger'}
+
+# Columns in display order with their labels
+COLUMNS = [
+    ('asset_id', 'Asset ID'),
+    ('metric', 'Metric'),
+    ('current_value', 'Current Value'),
+    ('predicted_failure', 'Predicted Failure'),
+    ('health_score', 'Health Score'),
+    ('status', 'Status'),
+    ('last_update', 'Last Update'),
+]
+
+# Sortable fields; status sorts by severity
+SORT_FIELDS = {
+    'asset_id': lambda r: r['asset_id'],
+    'metric': lambda r: r['metric'],
+    'current_value': lambda r: r['current_value'],
+    'predicted_failure': lambda r: r['predicted_failure'],
+    'health_score': lambda r: r['health_score'],
+    'status': lambda r: STATUSES.index(r['status']),
+    'last_update': lambda r: r['last_update'],
+}
+
+# JSON type of each sort field's values, checked when a cursor is decoded
+_NUMBER = (int, float)
+CURSOR_TYPES = {
+    'asset_id': str,
+    'metric': str,
+    'current_value': _NUMBER,
+    'predicted_failure': _NUMBER,
+    'health_score': _NUMBER,
+    'status': int,
+    'last_update': str,
+}
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 500
+
+
+def run_predictive_maintenance_demo(assets=None):
+    """Generate realistic maintenance records"""
+    # Live anomaly scores from the ingest path raise the failure estimate
+    anomaly_scores = load_alerts()['asset_scores']
+    if assets is None:
+        live = {a for a in anomaly_scores if a != 'market' and valid_asset_id(a)}
+        assets = DEMO_ASSETS + sorted(live - set(DEMO_ASSETS))
+
+    records = []
+    for i, asset in enumerate(assets):
+        metric = METRICS[i % len(METRICS)]
+        current_value = float(np.round(np.random.uniform(50, 100), 1))
+        failure_prob = np.random.uniform(0, 0.3) + anomaly_scores.get(asset, 0) * ANOMALY_RISK_WEIGHT
+        failure_prob = float(np.round(min(failure_prob, 0.99), 2))
+        health_score = float(np.round(100 - (failure_prob * 100), 1))
+
+        if failure_prob < 0.1:
+            status = 'Optimal'
+        elif failure_prob < 0.2:
+            status = 'Warning'
+        else:
+            status = 'Critical'
+
+        last_update = (datetime.now() - timedelta(hours=np.random.randint(0, 24))).strftime('%H:%M:%S')
+
+        records.append({
+            'asset_id': asset,
+            'metric': metric,
+            'current_value': current_value,
+            'predicted_failure': failure_prob,
+            'health_score': health_score,
+            'status': status,
+            'status_class': STATUS_CLASSES[status],
+            'last_update': last_update,
+        })
+    return records
+
+
+class MaintenanceIndex:
+    """One snapshot of records, pre-sorted for every sortable field"""
+
+    def __init__(self, records, version):
+        self.records = records
+        self.version = version
+        self.counts = {status: 0 for status in STATUSES}
+        for rec in records:
+            self.counts[rec['status']] += 1
+        self.sorted = {}
+        for field, key in SORT_FIELDS.items():
+            rows = sorted(records, key=lambda r: (key(r), r['asset_id']))
+            self.sorted[field] = ([(key(r), r['asset_id']) for r in rows], rows)
+
+    def query(self, sort='health_score', order='asc', status=None, asset=None,
+              min_health=None, max_health=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Return one page of records and the cursor of the next page.
+        status: exact status, asset: case-insensitive asset id substring
+        cursor: decoded with decode_cursor for the same sort and order
+        """
+        keys, rows = self.sorted[sort]
+        if cursor is not None:
+            cursor = tuple(cursor['key'])
+        asset = asset.lower() if asset else None
+
+        def matches(rec):
+            if status and rec['status'] != status:
+                return False
+            if asset and asset not in rec['asset_id'].lower():
+                return False
+            if min_health is not None and rec['health_score'] < min_health:
+                return False
+            if max_health is not None and rec['health_score'] > max_health:
+                return False
+            return True
+
+        if order == 'desc':
+            pos = bisect_left(keys, cursor) - 1 if cursor is not None else len(rows) - 1
+            positions = range(pos, -1, -1)
+        else:
+            pos = bisect_right(keys, cursor) if cursor is not None else 0
+            positions = range(pos, len(rows))
+
+        page = []
+        last_key = None
+        for i in positions:
+            if matches(rows[i]):
+                if len(page) == limit:
+                    break
+                page.append(rows[i])
+                last_key = keys[i]
+        else:
+            last_key = None
+
+        if last_key is None:
+            return page, None
+        return page, encode_cursor(sort, order, self.version, last_key)
+
+
+def encode_cursor(sort, order, version, key):
+    raw = json.dumps({'sort': sort, 'order': order, 'version': version, 'key': list(key)}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, sort, order):
+    """
+    Decode a page cursor issued for the given sort field and order.
+    Raises ValueError when it is malformed or was issued for another sort.
+    """
+    padded = token + '=' * (-len(token) % 4)
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value, asset = cursor['key']
+        valid = (
+            isinstance(value, CURSOR_TYPES[cursor['sort']]) and not isinstance(value, bool)
+            and isinstance(asset, str)
+            and isinstance(cursor['version'], int)
+        )
+    except Exception as exc:
+        raise ValueError('invalid cursor') from exc
+    if not valid:
+        raise ValueError('invalid cursor')
+    if cursor['sort'] != sort or cursor['order'] != order:
+        raise ValueError('cursor was issued for a different sort order')
+    return cursor
+
+
+# -------------------------------
+# Current snapshot
+# -------------------------------
+_snapshot = {'index': None, 'built_at': 0.0}
+_lock = threading.Lock()
+
+
+def current_index():
+    """Latest maintenance snapshot, regenerated when it is stale"""
+    with _lock:
+        index = _snapshot['index']
+        if index is None or time.time() - _snapshot['built_at'] >= MAINTENANCE_REFRESH:
+            records = run_predictive_maintenance_demo()
+            version = index.version + 1 if index is not None else 1
+            index = MaintenanceIndex(records, version)
+            _snapshot['index'] = index
+            _snapshot['built_at'] = time.time()
+            update_maintenance(records)
+        return index
@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics import backtest
+
+
+class Command(BaseCommand):
+    help = "Rolling-origin backtest of the forecasting models, comparing accuracy with fit time"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--models", default=",".join(backtest.MODELS),
+                            help="comma separated models: " + ", ".join(backtest.MODELS))
+        parser.add_argument("--series", default=",".join(backtest.PRICE_SERIES),
+                            help="comma separated price columns")
+        parser.add_argument("--horizon", type=int, default=backtest.DEFAULT_HORIZON,
+                            help="points forecast per fold")
+        parser.add_argument("--initial", type=int, default=backtest.DEFAULT_INITIAL,
+                            help="training points of the first fold")
+        parser.add_argument("--step", type=int, default=backtest.DEFAULT_STEP,
+                            help="points between fold origins")
+        parser.add_argument("--max-folds", type=int, default=backtest.DEFAULT_MAX_FOLDS,
+                            help="most recent folds evaluated per series (0 for all)")
+        parser.add_argument("--level", type=float, default=backtest.DEFAULT_LEVEL,
+                            help="prediction interval level for coverage")
+        parser.add_argument("--season", type=int, default=backtest.DEFAULT_SEASON,
+                            help="season length of the seasonal-naive model")
+        parser.add_argument("--resolution", default=backtest.DEFAULT_RESOLUTION,
+                            help="pandas frequency the prices are averaged to")
+        parser.add_argument("--workers", type=int, default=None,
+                            help="worker processes (default: CPU count)")
+        parser.add_argument("--no-cache", action="store_true",
+                            help="refit folds that are already cached")
+
+    def handle(self, *args, **options):
+        try:
+            report = backtest.run_backtest(
+                models=[m.strip() for m in options["models"].split(",") if m.strip()],
+                columns=[c.strip() for c in options["series"].split(",") if c.strip()],
+                horizon=options["horizon"],
+                initial=options["initial"],
+                step=options["step"],
+                max_folds=options["max_folds"],
+                level=options["level"],
+                season=options["season"],
+                resolution=options["resolution"],
+                workers=options["workers"],
+                use_cache=not options["no_cache"],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        for model, reason in report["skipped"].items():
+            self.stdout.write(f"Skipped {model}: {reason}")
+        if not report["models"]:
+            raise CommandError("no folds to evaluate; lower --initial or load more history")
+
+        self.stdout.write(f"{'model':<16} {'series':<12} {'folds':>6} {'cached':>7} {'MAE':>10} "
+                          f"{'MAPE %':>8} {'coverage':>9} {'fit ms':>10}")
+        for row in report["series"]:
+            self.stdout.write(
+                f"{row['model']:<16} {row['series']:<12} {row['folds']:>6} {row['cached']:>7} "
+                f"{_fmt(row['mae'], '.4f'):>10} {_fmt(row['mape'], '.2f'):>8} "
+                f"{_fmt(row['coverage'], '.1%'):>9} {_fmt(row['fit_seconds'] and row['fit_seconds'] * 1000, '.2f'):>10}"
+            )
+
+        self.stdout.write("")
+        self.stdout.write(f"{'model':<16} {'folds':>6} {'MAPE %':>8} {'coverage':>9} {'fit ms':>10}")
+        for row in report["models"]:
+            self.stdout.write(
+                f"{row['model']:<16} {row['folds']:>6} {_fmt(row['mape'], '.2f'):>8} "
+                f"{_fmt(row['coverage'], '.1%'):>9} {row['fit_seconds'] * 1000:>10.2f}"
+            )
+        self.stdout.write("")
+        self.stdout.write(
+            f"Fitted {report['fitted_folds']} folds in {report['wall_seconds']:.1f}s. "
+            f"Cheapest model within {backtest.GOOD_ENOUGH - 1:.0%} of the best MAPE: {report['recommended']}"
+        )
+        self.stdout.write(f"Report written to {backtest.REPORT_FILE}")
+
+
+def _fmt(value, spec):
+    return "-" if value is None else format(value, spec)
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from analytics import retention
+
+
+class Command(BaseCommand):
+    help = "Compact raw tick history into archive and rollup segments and report disk usage per tier"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--raw-days", type=float, default=retention.RAW_RETENTION_DAYS,
+                            help="days of raw ticks to keep in the raw tier")
+        parser.add_argument("--archive-days", type=float, default=retention.ARCHIVE_RETENTION_DAYS,
+                            help="days to keep archived raw ticks")
+        parser.add_argument("--every", type=float, default=None,
+                            help="keep running and compact every N seconds")
+        parser.add_argument("--report", action="store_true",
+                            help="only print disk usage per tier")
+
+    def handle(self, *args, **options):
+        while True:
+            if not options["report"]:
+                for summary in retention.run_retention(options["raw_days"], options["archive_days"]):
+                    self.stdout.write(
+                        f"{summary['dataset']}: archived {summary['archived_rows']} rows into "
+                        f"{summary['segments']} segments, expired {summary['expired']} segments"
+                    )
+            self.print_usage()
+            if options["every"] is None:
+                break
+            time.sleep(options["every"])
+
+    def print_usage(self):
+        self.stdout.write(f"{'dataset':<10} {'tier':<8} {'files':>6} {'rows':>10} {'MB':>10}")
+        for entry in retention.disk_usage():
+            rows = entry['rows'] if entry['rows'] is not None else '-'
+            self.stdout.write(
+                f"{entry['dataset']:<10} {entry['tier']:<8} {entry['files']:>6} "
+                f"{rows:>10} {entry['bytes'] / 1e6:>10.3f}"
+            )
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics import replay
+
+
+class Command(BaseCommand):
+    help = "Replay historical price or sensor files through the ingest path, resuming from checkpoints"
+
+    def add_arguments(self, parser):
+        parser.add_argument("sources", nargs="+", help="CSV or Parquet files with a Date column")
+        parser.add_argument("--dataset", choices=sorted(replay.FIELDS), default="prices")
+        parser.add_argument("--speed", type=float, default=0,
+                            help="replay at N times real time (0: as fast as possible)")
+        parser.add_argument("--batch-rows", type=int, default=replay.REPLAY_BATCH_ROWS,
+                            help="rows ingested per batch")
+        parser.add_argument("--workers", type=int, default=None,
+                            help="worker processes (default: CPU count)")
+        parser.add_argument("--partitions", type=int, default=None,
+                            help="sensor partitions by asset (default: one per worker)")
+        parser.add_argument("--restart", action="store_true",
+                            help="ignore checkpoints of an earlier run on the same files")
+        parser.add_argument("--no-rebuild", action="store_true",
+                            help="skip the bulk rebuild of history and rollups")
+
+    def handle(self, *args, **options):
+        try:
+            summary = replay.replay(
+                options["sources"],
+                dataset=options["dataset"],
+                speed=options["speed"],
+                batch_rows=max(1, options["batch_rows"]),
+                workers=options["workers"],
+                partitions=options["partitions"],
+                restart=options["restart"],
+                rebuild=not options["no_rebuild"],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        for part in summary["partitions"]:
+            resumed = f" (resumed after {part['resumed_at']} rows)" if part["resumed_at"] else ""
+            self.stdout.write(
+                f"partition {part['partition']}: {part['rows']} rows, {part['alerts']} alerts{resumed}"
+            )
+        rate = summary["rows_per_second"]
+        self.stdout.write(
+            f"Replayed {summary['rows']} {summary['dataset']} rows in {summary['seconds']:.1f}s"
+            + (f" ({rate:,.0f} rows/s)" if rate else "")
+            + f", {summary['alerts']} alerts"
+        )
+        if "compaction" in summary:
+            compaction = summary["compaction"]
+            self.stdout.write(
+                f"Rebuilt history: removed {summary['duplicates_removed']} duplicate rows, "
+                f"archived {compaction['archived_rows']} rows into {compaction['segments']} segments"
+            )
+        self.stdout.write(f"Checkpoints: {replay.REPLAY_DIR / summary['run']}")
@@ -1,28 +1,89 @@
 import json
+import threading
+import time
 import pandas as pd
 import paho.mqtt.client as mqtt
 from pathlib import Path
 
+from .ingest import PRICE_FIELDS, ingest_batch, valid_asset_id
+from .reorder import ReorderBuffer, parse_timestamp
+
 # Path to save incoming MQTT data
 DATA_FILE = Path("analytics/realtime_data.csv")
 
+PRICE_TOPIC = "oil_gas/sensors"
+ASSET_TOPIC_PREFIX = "oil_gas/assets/"
+
 # Initialize CSV if not exists
 if not DATA_FILE.exists():
-    df_init = pd.DataFrame(columns=["Date", "Brent", "WTI", "NaturalGas"])
+    df_init = pd.DataFrame(columns=PRICE_FIELDS)
     df_init.to_csv(DATA_FILE, index=False)
 
+# Ticks are released to the ingest files in Date order, without duplicates.
+# Releasing and writing happen under one lock so appends stay sorted.
+price_buffer = ReorderBuffer()
+sensor_buffer = ReorderBuffer()
+ingest_lock = threading.Lock()
+
+def write_prices(rows):
+    # Appends, checks for anomalies and updates the insights per batch
+    ingest_batch("prices", rows)
+
+def write_sensors(rows):
+    ingest_batch("sensors", rows)
+
+def expire_buffers(interval=1.0):
+    """Release ticks held too long while no newer ticks arrive"""
+    while True:
+        time.sleep(interval)
+        with ingest_lock:
+            write_prices(price_buffer.expire())
+            write_sensors(sensor_buffer.expire())
+
+def _normalise_date(payload):
+    """Parse the tick Date and store it back as naive local time"""
+    ts = parse_timestamp(payload.get("Date"))
+    if ts is not None:
+        # The CSV must not mix naive and offset-aware dates
+        payload["Date"] = ts.isoformat(sep=" ")
+    return ts
+
 # MQTT Callbacks
 def on_connect(client, userdata, flags, rc):
     print(f"Connected with result code {rc}")
-    client.subscribe("oil_gas/sensors")  # topic to subscribe
+    client.subscribe(PRICE_TOPIC)  # topic to subscribe
+    client.subscribe(ASSET_TOPIC_PREFIX + "#")  # per-asset sensor readings
 
 def on_message(client, userdata, msg):
-    payload = json.loads(msg.payload)
+    # An exception here stops the network loop, so bad payloads are dropped
+    try:
+        payload = json.loads(msg.payload)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        print(f"Dropped malformed message on {msg.topic}")
+        return
+    if msg.topic.startswith(ASSET_TOPIC_PREFIX):
+        # payload example: {"Date": "...", "Asset": "Pump-3", "Pressure": 74.1, ...}
+        if not valid_asset_id(payload.get("Asset")):
+            print(f"Dropped sensor reading with invalid asset id on {msg.topic}")
+            return
+        ts = _normalise_date(payload)
+        with ingest_lock:
+            _, released = sensor_buffer.push(payload.get("Asset"), ts, payload)
+            write_sensors(released)
+        return
     # payload example: {"Date": "2026-02-06", "Brent": 75.2, "WTI": 70.5, "NaturalGas": 2.1}
-    df = pd.read_csv(DATA_FILE)
-    df = pd.concat([df, pd.DataFrame([payload])], ignore_index=True)
-    df.to_csv(DATA_FILE, index=False)
-    print(f"New data appended: {payload}")
+    # Drop extra fields such as the simulator's "ts" latency stamp
+    payload = {k: payload[k] for k in PRICE_FIELDS if k in payload}
+    ts = _normalise_date(payload)
+    with ingest_lock:
+        accepted, released = price_buffer.push("prices", ts, payload)
+        write_prices(released)
+    if accepted:
+        print(f"New data received: {payload}")
+    else:
+        print(f"Dropped duplicate, late, future-dated or invalid tick: {payload}")
 
 # MQTT client
 def start_mqtt():
@@ -31,5 +92,6 @@ def start_mqtt():
     client.on_message = on_message
     client.connect("broker.hivemq.com", 1883, 60)  # public broker for testing
     client.loop_start()
+    threading.Thread(target=expire_buffers, name="reorder-expiry", daemon=True).start()
     print("MQTT Client started...")
     return client
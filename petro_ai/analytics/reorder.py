@@ -0,0 +1,138 @@
+# analytics/reorder.py
+"""
+Watermark reorder buffer for ingested ticks.
+
+MQTT gives no ordering or exactly-once guarantee and the Date field is set
+by the publisher, so ticks are held for a bounded lateness and released in
+timestamp order. Duplicates of (series, timestamp) are dropped, and ticks
+older than what has already been released are dropped as too late. The
+ingest files therefore stay sorted by Date and free of duplicates.
+
+Ticks dated ahead of the wall clock are rejected: one of them would move
+the watermark into the future and every real tick after it would count
+as late. Timestamps are compared as naive local time.
+"""
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+# Seconds of event time a tick may arrive behind the newest tick
+REORDER_LATENESS = 5.0
+# Wall-clock seconds a tick is held at most when no newer ticks arrive
+REORDER_MAX_HOLD = 10.0
+# Seconds a tick may be dated ahead of the wall clock (publisher clock skew)
+REORDER_MAX_FUTURE = 5.0
+
+
+def parse_timestamp(value):
+    """
+    Parse a tick Date as naive local time, returning None when it is not a
+    valid timestamp. Offset-aware dates are converted to local time.
+    """
+    try:
+        ts = datetime.fromisoformat(str(value))
+    except ValueError:
+        try:
+            ts = pd.Timestamp(value)
+        except (ValueError, TypeError, OverflowError):
+            return None
+        if pd.isna(ts):
+            return None
+        ts = ts.to_pydatetime()
+    try:
+        if ts.tzinfo is not None:
+            ts = ts.astimezone().replace(tzinfo=None)
+        # The buffer works on epoch seconds; dates near year 1 have none
+        ts.timestamp()
+    except (ValueError, OverflowError, OSError):
+        return None
+    return ts
+
+
+class ReorderBuffer:
+    """Releases rows in timestamp order once the watermark has passed them"""
+
+    def __init__(self, lateness=REORDER_LATENESS, max_hold=REORDER_MAX_HOLD,
+                 max_future=REORDER_MAX_FUTURE, clock=time.time):
+        self.lateness = lateness
+        self.max_hold = max_hold
+        self.max_future = max_future
+        # Wall clock in epoch seconds, used to reject future-dated ticks
+        self.clock = clock
+        self.heap = []
+        self.pending = set()
+        self.seq = itertools.count()
+        self.max_seen = None
+        self.released_upto = None
+        # Keys released at exactly released_upto, to catch duplicates of
+        # the newest released timestamp
+        self.released_keys = set()
+        self.lock = threading.Lock()
+        self.stats = {'received': 0, 'released': 0, 'duplicates': 0, 'late': 0, 'future': 0, 'invalid': 0}
+
+    def push(self, series, ts, row, now=None):
+        """
+        Offer one row. Returns (accepted, released) where released is the
+        list of rows that became safe to write, in timestamp order.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.stats['received'] += 1
+            if ts is None:
+                self.stats['invalid'] += 1
+                return False, self._release(now)
+            if ts.timestamp() > self.clock() + self.max_future:
+                self.stats['future'] += 1
+                return False, self._release(now)
+            key = (series, ts)
+            if key in self.pending or key in self.released_keys:
+                self.stats['duplicates'] += 1
+                return False, self._release(now)
+            if self.released_upto is not None and ts < self.released_upto:
+                self.stats['late'] += 1
+                return False, self._release(now)
+
+            heapq.heappush(self.heap, (ts, next(self.seq), now, series, row))
+            self.pending.add(key)
+            if self.max_seen is None or ts > self.max_seen:
+                self.max_seen = ts
+            return True, self._release(now)
+
+    def expire(self, now=None):
+        """Release rows held longer than max_hold; call periodically"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            return self._release(now)
+
+    def flush(self):
+        """Release everything that is buffered"""
+        with self.lock:
+            return self._release(None, everything=True)
+
+    def _release(self, now, everything=False):
+        released = []
+        if self.max_seen is None:
+            return released
+        watermark = self.max_seen.timestamp() - self.lateness
+        while self.heap:
+            ts, _, arrived, series, row = self.heap[0]
+            due = (
+                everything
+                or ts.timestamp() <= watermark
+                or (now is not None and now - arrived >= self.max_hold)
+            )
+            if not due:
+                break
+            heapq.heappop(self.heap)
+            self.pending.discard((series, ts))
+            if self.released_upto is None or ts > self.released_upto:
+                self.released_upto = ts
+                self.released_keys = set()
+            self.released_keys.add((series, ts))
+            released.append(row)
+        self.stats['released'] += len(released)
+        return released
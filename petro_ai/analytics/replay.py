@@ -0,0 +1,272 @@
+# analytics/replay.py
+"""
+Replay of historical price or sensor files through the ingest path.
+
+Rows are read from CSV or Parquet files and split into partitions: sensor
+readings by asset, while price ticks stay one partition because every row
+holds all commodities. Each partition is sorted, deduplicated and fed to
+ingest.ingest_batch in large batches, either as fast as possible or paced
+at N times real time. Partitions run in parallel worker processes that
+share the ingest CSV through a lock and send their alerts to the parent,
+which publishes them.
+
+Progress is checkpointed per partition after every batch, so an
+interrupted run resumes where it stopped. The batch in flight at the
+interruption may be written twice; the final rebuild removes the copy.
+When all partitions are done, derived data is rebuilt once in bulk: the
+ingest CSV is sorted and deduplicated and its Parquet copy rewritten, and
+old rows are compacted into archive and rollup segments.
+
+A replay never publishes insights itself; the ingest process stays their
+only writer. The rebuild starts a new history generation, on which the
+ingest process rebuilds its insights from the replayed history.
+"""
+import hashlib
+import multiprocessing as mp
+import os
+import queue
+import shutil
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from . import anomaly, retention
+from .ingest import FIELDS, batch_samples, ingest_batch
+from .storage import TEXT_COLUMNS, parse_dates, read_json, rebuild_history, write_json
+
+# Checkpoints, one directory per run
+REPLAY_DIR = Path("analytics/replay")
+
+REPLAY_BATCH_ROWS = 10_000
+# Rows read from a source file at a time
+READ_CHUNK_ROWS = 100_000
+# When paced, one batch covers at most this many seconds of wall-clock time
+PACE_INTERVAL = 1.0
+
+
+# -------------------------------
+# Reading partitions
+# -------------------------------
+def _read_chunks(path, columns):
+    path = Path(path)
+    if path.suffix == '.parquet':
+        parquet = pq.ParquetFile(path)
+        names = [c for c in columns if c in parquet.schema_arrow.names]
+        for batch in parquet.iter_batches(batch_size=READ_CHUNK_ROWS, columns=names):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=READ_CHUNK_ROWS, usecols=lambda c: c in columns)
+
+
+def _keys(dataset):
+    return ['Date'] + [c for c in TEXT_COLUMNS if c in FIELDS[dataset]]
+
+
+def partition_of(assets, partitions):
+    """Partition number per asset; crc32 keeps it equal in every process"""
+    codes, uniques = pd.factorize(assets)
+    parts = np.array([zlib.crc32(str(a).encode()) % partitions for a in uniques], dtype=np.int64)
+    return parts[codes]
+
+
+def load_partition(dataset, sources, partition=0, partitions=1):
+    """Rows of one partition from all sources, parsed, sorted and deduplicated"""
+    fields = FIELDS[dataset]
+    keys = _keys(dataset)
+    frames = []
+    for path in sources:
+        for chunk in _read_chunks(path, fields):
+            chunk = chunk.reindex(columns=fields)
+            chunk['Date'] = parse_dates(chunk['Date'])
+            chunk = chunk.dropna(subset=keys)
+            if partitions > 1:
+                chunk = chunk[partition_of(chunk['Asset'], partitions) == partition]
+            frames.append(chunk)
+    if not frames:
+        return pd.DataFrame(columns=fields)
+
+    df = pd.concat(frames, ignore_index=True)
+    for col in fields:
+        if col not in keys:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    df = df.sort_values(keys, kind='stable').drop_duplicates(subset=keys)
+    return df.reset_index(drop=True)
+
+
+def _first_date(sources):
+    """Earliest Date across the sources, reading only the Date column"""
+    first = None
+    for path in sources:
+        for chunk in _read_chunks(path, ['Date']):
+            date = parse_dates(chunk['Date']).min()
+            if pd.notna(date) and (first is None or date < first):
+                first = date
+    return first
+
+
+def _records(df):
+    """Rows as ingest payloads, formatted like the live MQTT ticks"""
+    out = df.copy()
+    out['Date'] = out['Date'].dt.strftime('%Y-%m-%d %H:%M:%S.%f').str[:-3]
+    return out.astype(object).where(out.notna(), None).to_dict('records')
+
+
+def _batches(dates, start_row, batch_rows, speed, origin):
+    """
+    (start, stop, due) row ranges of the batches. due is the wall-clock
+    offset from the start of the replay at which the batch may be written.
+    """
+    n = len(dates)
+    if not speed:
+        for start in range(start_row, n, batch_rows):
+            yield start, min(start + batch_rows, n), 0.0
+        return
+    offsets = (dates - origin).dt.total_seconds().to_numpy() / speed
+    start = start_row
+    while start < n:
+        stop = int(np.searchsorted(offsets, offsets[start] + PACE_INTERVAL, side='right'))
+        stop = min(max(stop, start + 1), start + batch_rows)
+        yield start, stop, float(offsets[stop - 1])
+        start = stop
+
+
+# -------------------------------
+# Workers
+# -------------------------------
+_shared = {}
+
+
+def _init_worker(lock, alerts):
+    _shared['lock'] = lock
+    _shared['alerts'] = alerts
+
+
+def _replay_partition(job):
+    """Replay one partition; runs in a worker process"""
+    dataset, sources, partition, partitions, run_dir, speed, origin, wall_start, batch_rows = job
+    checkpoint = Path(run_dir) / f"part-{partition}.json"
+    state = read_json(checkpoint, {'rows': 0, 'offset': 0.0, 'done': False})
+    result = {'partition': partition, 'rows': 0, 'resumed_at': state['rows'], 'alerts': 0}
+    if state['done']:
+        return result
+
+    df = load_partition(dataset, sources, partition, partitions)
+    detector = anomaly.StreamingDetector()
+    # Rows ingested before an interruption still warm up the detector, so a
+    # resumed run raises the same alerts as an uninterrupted one
+    for start in range(0, state['rows'], batch_rows):
+        rows = _records(df.iloc[start:min(start + batch_rows, state['rows'])])
+        anomaly.detect(detector, batch_samples(dataset, rows))
+
+    def check(samples):
+        return anomaly.detect(detector, samples)
+
+    for start, stop, due in _batches(df['Date'], state['rows'], batch_rows, speed, origin):
+        if speed:
+            time.sleep(max(0.0, wall_start + due - time.time()))
+        rows = _records(df.iloc[start:stop])
+        alerts = ingest_batch(dataset, rows, check=check, update_insights=False,
+                              lock=_shared['lock'])
+        if alerts:
+            _shared['alerts'].put(alerts)
+            result['alerts'] += len(alerts)
+        result['rows'] += stop - start
+        state.update(rows=stop, offset=due, total=len(df))
+        write_json(checkpoint, state)
+
+    state['done'] = True
+    write_json(checkpoint, state)
+    return result
+
+
+def _publish_alerts(alerts_queue):
+    alerts = []
+    while True:
+        try:
+            alerts.extend(alerts_queue.get_nowait())
+        except queue.Empty:
+            break
+    if alerts:
+        anomaly.record_alerts(alerts)
+
+
+# -------------------------------
+# Replay
+# -------------------------------
+def run_id(dataset, sources, partitions):
+    """Checkpoints belong to one dataset, partitioning and set of source files"""
+    digest = hashlib.sha1(repr((dataset, partitions)).encode())
+    for path in sources:
+        stat = Path(path).stat()
+        digest.update(f"{Path(path).resolve()}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+
+def replay(sources, dataset='prices', speed=None, batch_rows=REPLAY_BATCH_ROWS,
+           workers=None, partitions=None, restart=False, rebuild=True):
+    """
+    Replay historical files through the ingest path.
+    speed: None or 0 for as fast as possible, otherwise N times real time
+    partitions: sensor partitions by asset (default: one per worker)
+    restart: discard the checkpoints of a previous run on the same files
+    rebuild: rebuild the history and rollups in bulk at the end
+    Returns a summary dict.
+    """
+    if dataset not in FIELDS:
+        raise ValueError(f'unknown dataset: {dataset}')
+    sources = [str(Path(s)) for s in sources]
+    for path in sources:
+        if not Path(path).exists():
+            raise ValueError(f'no such file: {path}')
+    workers = workers or os.cpu_count() or 1
+    partitions = 1 if dataset == 'prices' else max(1, partitions or workers)
+
+    run_dir = REPLAY_DIR / run_id(dataset, sources, partitions)
+    if restart and run_dir.exists():
+        shutil.rmtree(run_dir)
+    run_dir.mkdir(parents=True, exist_ok=True)
+
+    origin = _first_date(sources) if speed else None
+    # A resumed paced run continues from the slowest partition's position
+    resume_offset = min(
+        read_json(run_dir / f"part-{p}.json", {'offset': 0.0})['offset'] for p in range(partitions)
+    )
+    wall_start = time.time() - resume_offset
+
+    jobs = [
+        (dataset, sources, p, partitions, str(run_dir), speed, origin, wall_start, batch_rows)
+        for p in range(partitions)
+    ]
+    started = time.perf_counter()
+    ctx = mp.get_context("spawn")
+    alerts_queue = ctx.Queue()
+    with ProcessPoolExecutor(min(workers, partitions), mp_context=ctx,
+                             initializer=_init_worker, initargs=(ctx.Lock(), alerts_queue)) as pool:
+        pending = {pool.submit(_replay_partition, job) for job in jobs}
+        results = []
+        while pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            results.extend(f.result() for f in done)
+            _publish_alerts(alerts_queue)
+    _publish_alerts(alerts_queue)
+    seconds = time.perf_counter() - started
+
+    rows = sum(r['rows'] for r in results)
+    summary = {
+        'dataset': dataset,
+        'run': run_dir.name,
+        'partitions': sorted(results, key=lambda r: r['partition']),
+        'rows': rows,
+        'alerts': sum(r['alerts'] for r in results),
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds > 0 else None,
+    }
+    if rebuild:
+        summary['duplicates_removed'] = rebuild_history(dataset)
+        summary['compaction'] = retention.compact(dataset)
+    return summary
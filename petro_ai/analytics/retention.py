@@ -0,0 +1,230 @@
+# analytics/retention.py
+"""
+Retention and compaction of the raw tick history.
+
+Storage tiers per dataset:
+- raw:     the ingest CSV and its Parquet snapshot files, holding the last
+           RAW_RETENTION_DAYS of ticks
+- archive: older ticks, moved into zstd-compressed monthly Parquet segments
+           and deleted after ARCHIVE_RETENTION_DAYS
+- rollup:  bucket means (ROLLUP_FREQ) of everything that left the raw tier,
+           kept indefinitely for long-range charts
+
+Segments are listed in CATALOG_FILE with their time span so readers only
+open the segments overlapping their query (see storage.tier_files).
+Readers take the segments from the published snapshot, so new segments and
+the trimmed raw tier become visible together, and expired segments are
+only deleted after storage.SNAPSHOT_GRACE.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .storage import (
+    CATALOG_FILE, DATASETS, ROW_GROUP_SIZE, SEGMENT_DIR, SNAPSHOT_DIR, TEXT_COLUMNS,
+    iter_history, parse_dates, publish_snapshot, read_json, rewrite_csv, snapshot_files,
+    snapshot_lock, sync_history, write_json,
+)
+
+RAW_RETENTION_DAYS = 7
+ARCHIVE_RETENTION_DAYS = 365
+ROLLUP_FREQ = '1h'
+ARCHIVE_COMPRESSION = 'zstd'
+
+_lock = threading.Lock()
+
+
+def _segment_path(tier, dataset, start, end):
+    # Unique per write: a merged segment never replaces a file that a
+    # published snapshot may still be reading
+    name = f"{start:%Y%m%dT%H%M%S}_{end:%Y%m%dT%H%M%S}_{time.time_ns():x}.parquet"
+    return f"{tier}/{dataset}/{name}"
+
+
+def _write_segment(df, tier, dataset, compression):
+    start, end = df['Date'].min(), df['Date'].max()
+    rel = _segment_path(tier, dataset, start, end)
+    path = SEGMENT_DIR / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    pq.write_table(
+        pa.Table.from_pandas(df, preserve_index=False), tmp,
+        row_group_size=ROW_GROUP_SIZE, compression=compression,
+    )
+    os.replace(tmp, path)
+    return {
+        'dataset': dataset,
+        'tier': tier,
+        'path': rel,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'rows': len(df),
+        'bytes': path.stat().st_size,
+    }
+
+
+def _keys(df):
+    return ['Date'] + [c for c in TEXT_COLUMNS if c in df.columns]
+
+
+def _rollup(df):
+    out = df.copy()
+    out['Date'] = out['Date'].dt.floor(ROLLUP_FREQ)
+    return out.groupby(_keys(out), sort=True).mean(numeric_only=True).reset_index()
+
+
+def _read_segments(segments):
+    return [pq.read_table(SEGMENT_DIR / seg['path']).to_pandas() for seg in segments]
+
+
+def _merge_month(catalog, dataset, month):
+    """
+    Merge newly archived rows of one month into that month's archive and
+    rollup segments, replacing their catalog entries.
+    Returns the paths of the replaced segment files.
+    """
+    period = month['Date'].iloc[0].to_period('M')
+    old = {'archive': [], 'rollup': []}
+    kept = []
+    for seg in catalog['segments']:
+        if (seg['dataset'] == dataset and seg['tier'] in old
+                and pd.Timestamp(seg['start']).to_period('M') == period):
+            old[seg['tier']].append(seg)
+        else:
+            kept.append(seg)
+
+    keys = _keys(month)
+    if old['archive'] or not old['rollup']:
+        # Rows left in both tiers by an interrupted run are archived once
+        archive = (
+            pd.concat(_read_segments(old['archive']) + [month], ignore_index=True)
+            .sort_values(keys, kind='stable')
+            .drop_duplicates(subset=keys, keep='last')
+        )
+        rollup = _rollup(archive)
+    else:
+        # The month's archive has expired; only its rollup is left to extend
+        archive = month
+        rollup = pd.concat(_read_segments(old['rollup']) + [_rollup(month)], ignore_index=True)
+        rollup = rollup.groupby(keys, sort=True).mean(numeric_only=True).reset_index()
+
+    kept.append(_write_segment(archive, 'archive', dataset, ARCHIVE_COMPRESSION))
+    kept.append(_write_segment(rollup, 'rollup', dataset, ARCHIVE_COMPRESSION))
+    catalog['segments'] = kept
+    return [SEGMENT_DIR / seg['path'] for seg in old['archive'] + old['rollup']]
+
+
+def _trim_raw(csv_file, cutoff, size):
+    """
+    Rewrite the ingest CSV keeping rows at or after cutoff. Only the first
+    size bytes, the rows that were archived, are trimmed; later appends
+    are kept whatever their Date.
+    """
+    def trim(raw):
+        dates = parse_dates(raw['Date'])
+        return raw[dates >= cutoff]
+
+    return rewrite_csv(csv_file, trim, size)
+
+
+def compact(dataset='prices', raw_days=RAW_RETENTION_DAYS,
+            archive_days=ARCHIVE_RETENTION_DAYS, now=None):
+    """
+    Move ticks older than raw_days out of the raw tier into one archive and
+    one rollup segment per month, then expire archive segments older than
+    archive_days. Returns a summary dict.
+    """
+    now = pd.Timestamp(now or datetime.now())
+    # On a rollup boundary, so no bucket is split between two runs
+    cutoff = (now - pd.Timedelta(days=raw_days)).floor(ROLLUP_FREQ)
+    csv_file = DATASETS[dataset]
+    summary = {'dataset': dataset, 'archived_rows': 0, 'segments': 0, 'expired': 0}
+    replaced = []
+
+    # Readers keep using the published snapshot while compaction runs
+    with _lock, snapshot_lock():
+        catalog = read_json(CATALOG_FILE, {'segments': []})
+        snapshot = sync_history(dataset, wait=True)
+        raw_files = snapshot_files(dataset, snapshot)
+
+        if raw_files:
+            # History is sorted, so months arrive one after another and only
+            # one month is held in memory at a time
+            def flush(parts):
+                month = pd.concat(parts, ignore_index=True)
+                replaced.extend(_merge_month(catalog, dataset, month))
+                summary['segments'] += 2
+                summary['archived_rows'] += len(month)
+
+            parts, current = [], None
+            before_cutoff = cutoff - pd.Timedelta(microseconds=1)
+            batches = (
+                batch for path in raw_files
+                for batch in iter_history(None, None, before_cutoff, path)
+            )
+            for batch in batches:
+                df = batch.to_pandas()
+                periods = df['Date'].dt.to_period('M')
+                for period, part in df.groupby(periods, sort=True):
+                    if current is not None and period != current:
+                        flush(parts)
+                        parts = []
+                    parts.append(part)
+                    current = period
+            if parts:
+                flush(parts)
+
+            if summary['archived_rows']:
+                # Catalog first: a crash after this point leaves the rows in
+                # both tiers, never in neither. The sync below publishes the
+                # new segments and the trimmed raw tier in one snapshot.
+                write_json(CATALOG_FILE, catalog)
+                _trim_raw(csv_file, cutoff, snapshot['csv'][0])
+                sync_history(dataset, wait=True)
+
+        expire_before = now - pd.Timedelta(days=archive_days)
+        kept, expired = [], []
+        for seg in catalog['segments']:
+            if seg['tier'] == 'archive' and seg['dataset'] == dataset and pd.Timestamp(seg['end']) < expire_before:
+                expired.append(SEGMENT_DIR / seg['path'])
+            else:
+                kept.append(seg)
+        if expired:
+            catalog['segments'] = kept
+            write_json(CATALOG_FILE, catalog)
+        summary['expired'] = len(expired)
+        if replaced or expired:
+            publish_snapshot(dataset, retire=replaced + expired)
+
+    return summary
+
+
+def disk_usage():
+    """Bytes, files and rows per tier and dataset"""
+    usage = {}
+    for dataset, csv_file in DATASETS.items():
+        raw = [p for p in [csv_file, *SNAPSHOT_DIR.glob(f"{dataset}-*.parquet")] if p.exists()]
+        usage[(dataset, 'raw')] = {
+            'files': len(raw),
+            'bytes': sum(p.stat().st_size for p in raw),
+            'rows': None,
+        }
+    for seg in read_json(CATALOG_FILE, {'segments': []})['segments']:
+        entry = usage.setdefault((seg['dataset'], seg['tier']), {'files': 0, 'bytes': 0, 'rows': 0})
+        entry['files'] += 1
+        entry['bytes'] += seg['bytes']
+        entry['rows'] = (entry['rows'] or 0) + seg['rows']
+    return [
+        {'dataset': dataset, 'tier': tier, **entry}
+        for (dataset, tier), entry in sorted(usage.items())
+    ]
+
+
+def run_retention(raw_days=RAW_RETENTION_DAYS, archive_days=ARCHIVE_RETENTION_DAYS):
+    """Compact every dataset"""
+    return [compact(dataset, raw_days, archive_days) for dataset in DATASETS]
@@ -0,0 +1,417 @@
+# analytics/simulator.py
+"""
+Load simulator for the ingestion path.
+
+Generates correlated commodity price ticks and per-asset sensor readings
+from several worker processes and reports the achieved publish rate and
+end-to-end latency measured by a collector subscribed to the same topics.
+With --ingest every received message is also fed through the live ingest
+path (analytics.mqtt_client.on_message), so the latency covers reordering,
+the CSV append, the anomaly check and the insights update.
+
+Run from the project directory:
+    python -m analytics.simulator --assets 5000 --rate 20000 --duration 30
+    python -m analytics.simulator --transport mqtt --broker localhost
+    python -m analytics.simulator --ingest --assets 100 --rate 2000
+"""
+import argparse
+import json
+import multiprocessing as mp
+import queue
+import random
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+
+# Topics (price topic is the one analytics.mqtt_client subscribes to)
+PRICE_TOPIC = "oil_gas/sensors"
+ASSET_TOPIC = "oil_gas/assets/{asset}"
+
+# Starting prices and daily volatility of the simulated commodities
+PRICE_START = {"Brent": 70.0, "WTI": 65.0, "NaturalGas": 2.0}
+PRICE_VOLATILITY = np.array([0.02, 0.022, 0.04])
+PRICE_CORRELATION = np.array([
+    [1.00, 0.95, 0.30],
+    [0.95, 1.00, 0.30],
+    [0.30, 0.30, 1.00],
+])
+
+# Sensor metrics with (baseline, noise) per reading
+SENSOR_METRICS = {
+    "Pressure": (75.0, 2.0),
+    "Temperature": (80.0, 1.5),
+    "Vibration": (60.0, 3.0),
+    "FlowRate": (90.0, 2.5),
+    "Efficiency": (92.0, 1.0),
+}
+# Probability that a reading carries a fault spike
+SPIKE_PROBABILITY = 0.001
+
+# How often workers wake up to publish the messages that are due
+WORKER_TICK = 0.01
+SECONDS_PER_DAY = 86400.0
+
+# Latencies kept for the percentiles. Past this the collector keeps a uniform
+# reservoir sample, so long runs use constant memory.
+LATENCY_SAMPLES = 100_000
+
+
+def asset_name(index):
+    """Asset IDs follow the maintenance table naming"""
+    return f"Pump-{index + 1}"
+
+
+def _timestamp():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+# -------------------------------
+# Tick generators
+# -------------------------------
+class PriceGenerator:
+    """Correlated geometric Brownian motion for the commodity prices"""
+
+    def __init__(self, rng, tick_seconds):
+        self.rng = rng
+        self.names = list(PRICE_START)
+        self.prices = np.array(list(PRICE_START.values()))
+        self.chol = np.linalg.cholesky(PRICE_CORRELATION)
+        self.scale = PRICE_VOLATILITY * np.sqrt(tick_seconds / SECONDS_PER_DAY)
+
+    def next(self):
+        shocks = self.chol @ self.rng.standard_normal(len(self.names))
+        self.prices *= np.exp(shocks * self.scale - 0.5 * self.scale ** 2)
+        payload = {"Date": _timestamp()}
+        payload.update({name: round(float(p), 2) for name, p in zip(self.names, self.prices)})
+        return payload
+
+
+class SensorGenerator:
+    """Mean-reverting sensor streams for a block of assets"""
+
+    def __init__(self, rng, asset_ids):
+        self.rng = rng
+        self.asset_ids = asset_ids
+        self.metrics = list(SENSOR_METRICS)
+        self.baseline = np.array([b for b, _ in SENSOR_METRICS.values()])
+        self.noise = np.array([n for _, n in SENSOR_METRICS.values()])
+        # Each asset runs slightly off the nominal baseline
+        offsets = rng.normal(0, 0.05, (len(asset_ids), len(self.metrics)))
+        self.levels = self.baseline * (1 + offsets)
+        self.values = self.levels.copy()
+        self.cursor = 0
+
+    def next_batch(self, n):
+        """Produce n readings, cycling through the assets round-robin"""
+        idx = (self.cursor + np.arange(n)) % len(self.asset_ids)
+        self.cursor = (self.cursor + n) % len(self.asset_ids)
+
+        # AR(1) step towards each asset's level
+        step = self.rng.standard_normal((n, len(self.metrics))) * self.noise
+        self.values[idx] += 0.2 * (self.levels[idx] - self.values[idx]) + 0.3 * step
+        readings = self.values[idx].copy()
+
+        spikes = self.rng.random(n) < SPIKE_PROBABILITY
+        if spikes.any():
+            readings[spikes] += self.noise * 10 * self.rng.choice([-1, 1], (spikes.sum(), 1))
+
+        date = _timestamp()
+        readings = np.round(readings, 2)
+        batch = []
+        for row, asset_idx in zip(readings, idx):
+            asset = self.asset_ids[asset_idx]
+            payload = {"Date": date, "Asset": asset}
+            payload.update(zip(self.metrics, row.tolist()))
+            batch.append((ASSET_TOPIC.format(asset=asset), payload))
+        return batch
+
+
+# -------------------------------
+# Transports
+# -------------------------------
+class LoopbackTransport:
+    """In-process broker stand-in: batches go straight to the collector queue"""
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def publish_batch(self, batch):
+        self.channel.put([(topic, json.dumps(payload)) for topic, payload in batch])
+
+    def close(self):
+        pass
+
+
+class MQTTTransport:
+    """Publishes every message to an MQTT broker"""
+
+    def __init__(self, host, port):
+        import paho.mqtt.client as mqtt
+
+        self.client = mqtt.Client()
+        self.client.max_queued_messages_set(0)
+        self.client.connect(host, port, 60)
+        self.client.loop_start()
+
+    def publish_batch(self, batch):
+        for topic, payload in batch:
+            self.client.publish(topic, json.dumps(payload))
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+# -------------------------------
+# Worker processes
+# -------------------------------
+def _publisher(worker_id, asset_ids, options, channel, results):
+    """Publish sensor readings (and prices on worker 0) at the target rate"""
+    if options["transport"] == "loopback":
+        transport = LoopbackTransport(channel)
+    else:
+        transport = MQTTTransport(options["broker"], options["port"])
+
+    rng = np.random.default_rng(options["seed"] + worker_id)
+    sensors = SensorGenerator(rng, asset_ids) if asset_ids else None
+    prices = None
+    if worker_id == 0 and options["price_rate"] > 0:
+        prices = PriceGenerator(rng, 1.0 / options["price_rate"])
+
+    sensor_rate = options["rate"] / options["workers"] if sensors else 0
+    sent = price_sent = 0
+    start = time.perf_counter()
+    deadline = start + options["duration"]
+
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        elapsed = now - start
+        batch = []
+
+        if prices is not None:
+            due = int(elapsed * options["price_rate"]) + 1 - price_sent
+            for _ in range(max(due, 0)):
+                batch.append((PRICE_TOPIC, prices.next()))
+            price_sent += max(due, 0)
+
+        if sensors is not None:
+            due = int(elapsed * sensor_rate) - sent
+            if due > 0:
+                batch.extend(sensors.next_batch(due))
+                sent += due
+
+        if batch:
+            stamp = time.time()
+            for _, payload in batch:
+                payload["ts"] = stamp
+            transport.publish_batch(batch)
+
+        time.sleep(max(0.0, WORKER_TICK - (time.perf_counter() - now)))
+
+    transport.close()
+    results.put(sent + price_sent)
+
+
+# -------------------------------
+# Collector
+# -------------------------------
+class Collector:
+    """
+    Counts received messages and records publish-to-handled latency.
+    The latency is taken after the handler returns, so it includes the
+    handler's work. At most `samples` latencies are kept.
+    """
+
+    def __init__(self, handler=None, samples=LATENCY_SAMPLES, seed=0):
+        self.handler = handler
+        self.received = 0
+        self.latencies = np.empty(samples)
+        self.max_latency = 0.0
+        self.rng = random.Random(seed)
+
+    def receive(self, topic, raw):
+        payload = json.loads(raw)
+        sent = payload.pop("ts", None)
+        if self.handler is not None:
+            self.handler(topic, payload)
+        if sent is not None:
+            self._record(time.time() - sent)
+        self.received += 1
+
+    def _record(self, latency):
+        # Reservoir sampling: every message has the same chance of being kept
+        self.max_latency = max(self.max_latency, latency)
+        slot = self.received
+        if slot >= len(self.latencies):
+            slot = self.rng.randrange(self.received + 1)
+            if slot >= len(self.latencies):
+                return
+        self.latencies[slot] = latency
+
+    def summary(self):
+        if not self.received:
+            return {"received": 0}
+        lat = self.latencies[:min(self.received, len(self.latencies))] * 1000
+        return {
+            "received": self.received,
+            "latency_ms_p50": round(float(np.percentile(lat, 50)), 2),
+            "latency_ms_p95": round(float(np.percentile(lat, 95)), 2),
+            "latency_ms_p99": round(float(np.percentile(lat, 99)), 2),
+            "latency_ms_max": round(self.max_latency * 1000, 2),
+        }
+
+
+class IngestHandler:
+    """Feeds received messages through the live MQTT ingest callback"""
+
+    def __init__(self):
+        # Imported here: it creates the ingest CSV relative to the cwd
+        from . import mqtt_client
+
+        self.client = mqtt_client
+
+    def __call__(self, topic, payload):
+        msg = SimpleNamespace(topic=topic, payload=json.dumps(payload).encode())
+        self.client.on_message(None, None, msg)
+
+    def close(self):
+        """Write out the ticks still held by the reorder buffers"""
+        with self.client.ingest_lock:
+            self.client.write_prices(self.client.price_buffer.flush())
+            self.client.write_sensors(self.client.sensor_buffer.flush())
+
+
+def _subscribe_collector(collector, host, port):
+    import paho.mqtt.client as mqtt
+
+    def on_message(client, userdata, msg):
+        collector.receive(msg.topic, msg.payload)
+
+    client = mqtt.Client()
+    client.on_message = on_message
+    client.connect(host, port, 60)
+    client.subscribe([(PRICE_TOPIC, 0), ("oil_gas/assets/#", 0)])
+    client.loop_start()
+    return client
+
+
+def run(assets=1000, rate=10000, price_rate=1.0, duration=10.0, workers=4,
+        transport="loopback", broker="localhost", port=1883, seed=0, handler=None,
+        ingest=False):
+    """
+    Run the simulator and return a report dict.
+    handler: optional callable(topic, payload) invoked for every received message
+    ingest: feed received messages through the live ingest path (writes the
+    ingest files under analytics/)
+    """
+    if ingest:
+        handler = IngestHandler()
+    workers = max(1, workers)
+    options = {
+        "transport": transport, "broker": broker, "port": port,
+        "rate": rate, "price_rate": price_rate, "duration": duration,
+        "workers": workers, "seed": seed,
+    }
+    asset_ids = [asset_name(i) for i in range(assets)]
+    partitions = [asset_ids[i::workers] for i in range(workers)]
+
+    ctx = mp.get_context("spawn")
+    channel = ctx.Queue(maxsize=10000)
+    results = ctx.Queue()
+    collector = Collector(handler, seed=seed)
+    subscriber = None
+    if transport == "mqtt":
+        subscriber = _subscribe_collector(collector, broker, port)
+        time.sleep(0.5)
+
+    procs = [
+        ctx.Process(target=_publisher, args=(i, partitions[i], options, channel, results))
+        for i in range(workers)
+    ]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+
+    published = 0
+    finished = 0
+    while finished < workers:
+        try:
+            for topic, raw in channel.get(timeout=0.1):
+                collector.receive(topic, raw)
+        except queue.Empty:
+            pass
+        while True:
+            try:
+                published += results.get_nowait()
+                finished += 1
+            except queue.Empty:
+                break
+
+    # Drain whatever is still in flight. Loopback messages are all queued by
+    # now but a slow handler may still be working through them.
+    if subscriber is not None:
+        drain_timeout = 2.0
+    else:
+        drain_timeout = 60.0 if handler is not None else 0.5
+    drain_until = time.perf_counter() + drain_timeout
+    while time.perf_counter() < drain_until and collector.received < published:
+        try:
+            for topic, raw in channel.get(timeout=0.1):
+                collector.receive(topic, raw)
+        except queue.Empty:
+            pass
+    elapsed = time.perf_counter() - start
+
+    for p in procs:
+        p.join()
+    if subscriber is not None:
+        subscriber.loop_stop()
+        subscriber.disconnect()
+    if ingest:
+        handler.close()
+
+    report = {
+        "transport": transport,
+        "ingest": ingest,
+        "assets": assets,
+        "workers": workers,
+        "target_rate": rate + price_rate,
+        "published": published,
+        "elapsed_s": round(elapsed, 2),
+        "publish_rate": round(published / duration, 1),
+    }
+    report.update(collector.summary())
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate oil & gas price and sensor traffic")
+    parser.add_argument("--assets", type=int, default=1000, help="number of simulated assets")
+    parser.add_argument("--rate", type=float, default=10000, help="sensor messages per second")
+    parser.add_argument("--price-rate", type=float, default=1.0, help="price ticks per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--workers", type=int, default=mp.cpu_count(), help="publisher processes")
+    parser.add_argument("--transport", choices=["loopback", "mqtt"], default="loopback")
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ingest", action="store_true",
+                        help="feed received messages through the live ingest path")
+    args = parser.parse_args(argv)
+
+    report = run(
+        assets=args.assets, rate=args.rate, price_rate=args.price_rate,
+        duration=args.duration, workers=args.workers, transport=args.transport,
+        broker=args.broker, port=args.port, seed=args.seed, ingest=args.ingest,
+    )
+    for key, value in report.items():
+        print(f"{key:>16}: {value}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
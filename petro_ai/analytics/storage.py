@@ -0,0 +1,676 @@
+# analytics/storage.py
+import csv
+import io
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from dateutil.tz import tzlocal
+from pathlib import Path
+
+from .reorder import parse_timestamp
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Raw ingest file written by the MQTT client
+REALTIME_FILE = Path("analytics/realtime_data.csv")
+
+# Raw sensor readings appended by the MQTT client
+SENSOR_FILE = Path("analytics/sensor_data.csv")
+
+PRICE_COLUMNS = ["Brent", "WTI", "NaturalGas"]
+SENSOR_COLUMNS = ["Pressure", "Temperature", "Vibration", "FlowRate", "Efficiency"]
+# Non-numeric columns besides Date
+TEXT_COLUMNS = ["Asset"]
+
+# Ingest file per dataset
+DATASETS = {
+    'prices': REALTIME_FILE,
+    'sensors': SENSOR_FILE,
+}
+
+# Published snapshots of each dataset. A snapshot is a Parquet copy of the
+# ingest CSV (the raw files) plus the compacted segments, listed in a
+# manifest ("{dataset}.json") that is replaced atomically. Readers resolve
+# all files from one manifest, so they never see a partly written file or
+# a half-finished compaction, and never wait for a publish to finish.
+SNAPSHOT_DIR = Path("analytics/snapshots")
+SNAPSHOT_LOCK = SNAPSHOT_DIR / ".publish.lock"
+# Superseded snapshot files are kept this long for readers still using them
+SNAPSHOT_GRACE = 30.0
+# Rows appended to the ingest CSV are converted into a small raw file of
+# their own; once this many small files trail the snapshot they are merged
+RAW_DELTA_FILES = 16
+
+# Compacted segments (rollup and archive tiers) and their catalog
+SEGMENT_DIR = Path("analytics/history")
+CATALOG_FILE = SEGMENT_DIR / "catalog.json"
+
+# Rows per Parquet row group. Each group carries min/max statistics for
+# the Date column, so time range queries skip groups outside the window.
+ROW_GROUP_SIZE = 50_000
+
+
+# -------------------------------
+# Locks
+# -------------------------------
+def _try_lock(f, blocking):
+    if fcntl is not None:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            return True
+        except BlockingIOError:
+            return False
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.01)
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """
+    Exclusive lock on a lock file, shared by all threads and processes.
+    The operating system releases it when the holder exits, so a crashed
+    process never leaves it behind. Yields False instead of waiting when
+    blocking is False and the lock is held.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a+b') as f:
+        if not _try_lock(f, blocking):
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# -------------------------------
+# Snapshots
+# -------------------------------
+_publish_lock = threading.RLock()
+_publish_depth = [0]
+
+
+@contextmanager
+def snapshot_lock(blocking=True):
+    """
+    Serialise snapshot publishers across threads and processes; readers
+    never take it. Re-entrant within a thread. Yields False instead of
+    waiting when blocking is False and another publisher holds the lock.
+    """
+    if not _publish_lock.acquire(blocking):
+        yield False
+        return
+    try:
+        if _publish_depth[0]:
+            _publish_depth[0] += 1
+            try:
+                yield True
+            finally:
+                _publish_depth[0] -= 1
+            return
+        with file_lock(SNAPSHOT_LOCK, blocking) as locked:
+            if not locked:
+                yield False
+                return
+            _publish_depth[0] += 1
+            try:
+                yield True
+            finally:
+                _publish_depth[0] -= 1
+    finally:
+        _publish_lock.release()
+
+
+def _empty_snapshot():
+    return {'version': 0, 'generation': 0, 'raw': [], 'csv': None, 'segments': [], 'retired': []}
+
+
+def current_snapshot(dataset='prices'):
+    """Latest published manifest of a dataset, without publishing"""
+    return read_json(SNAPSHOT_DIR / f"{dataset}.json") or _empty_snapshot()
+
+
+def _csv_state(csv_file):
+    try:
+        stat = csv_file.stat()
+    except FileNotFoundError:
+        return None
+    # The inode changes when a rewrite replaces the file
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def publish_snapshot(dataset, raw=None, csv_state=None, keep_raw=True, retire=(), rebuilt=False):
+    """
+    Publish a new snapshot of a dataset: the given raw history files (or
+    the current ones when keep_raw is set) and the dataset's catalog
+    segments.
+    raw: [{'path': file name, 'rows': row count}] in Date order
+    csv_state: [bytes of the ingest CSV held by raw, CSV mtime in ns, inode]
+    retire: paths of files the new snapshot no longer uses
+    rebuilt: the history was rewritten rather than appended to; bumps the
+    manifest's generation so state derived from the old history is rebuilt
+    Call with snapshot_lock held. Returns the new manifest.
+    """
+    previous = current_snapshot(dataset)
+    if keep_raw and raw is None:
+        raw, csv_state = previous['raw'], previous['csv']
+    raw = raw or []
+    now = time.time()
+    retired = previous.get('retired', []) + [[str(path), now] for path in retire]
+    kept_raw = {entry['path'] for entry in raw}
+    retired.extend(
+        [str(SNAPSHOT_DIR / entry['path']), now]
+        for entry in previous['raw'] if entry['path'] not in kept_raw
+    )
+
+    # Retired files are removed once no reader can still be starting on
+    # them; an open file survives its removal on POSIX, and a removal that
+    # fails on Windows is retried at the next publish
+    kept = []
+    for path, retired_at in retired:
+        if now - retired_at > SNAPSHOT_GRACE:
+            try:
+                Path(path).unlink(missing_ok=True)
+                continue
+            except OSError:
+                pass
+        kept.append([path, retired_at])
+
+    manifest = {
+        'version': previous['version'] + 1,
+        'generation': previous.get('generation', 0) + int(rebuilt),
+        'raw': raw,
+        'csv': csv_state,
+        'segments': [
+            seg for seg in read_json(CATALOG_FILE, {'segments': []})['segments']
+            if seg['dataset'] == dataset
+        ],
+        'retired': kept,
+        'published_at': now,
+    }
+    write_json(SNAPSHOT_DIR / f"{dataset}.json", manifest)
+    return manifest
+
+
+def parse_dates(values):
+    """
+    Dates as naive local time, NaT where they do not parse. Offset-aware
+    dates are converted to local time, as the ingest path stores them.
+    """
+    try:
+        dates = pd.to_datetime(values, errors='coerce', format='mixed')
+    except ValueError:
+        # Naive and offset-aware dates in one column, as older ingest code
+        # wrote them; rare enough to parse one value at a time
+        dates = pd.to_datetime(pd.Series(values).map(parse_timestamp), errors='coerce')
+    if getattr(dates.dt, 'tz', None) is not None:
+        dates = dates.dt.tz_convert(tzlocal()).dt.tz_localize(None)
+    return dates
+
+
+def _parse_csv(data, names=None):
+    """
+    Typed rows of complete CSV lines, sorted by Date, or None without a
+    Date column.
+    names: column names when data has no header line
+    """
+    df = pd.read_csv(io.BytesIO(data), header=None if names else 'infer', names=names)
+    if 'Date' not in df.columns:
+        return None
+    df['Date'] = parse_dates(df['Date'])
+    df = df.dropna(subset=['Date'])
+    # The MQTT client appends in Date order; only legacy files need a sort
+    if not df['Date'].is_monotonic_increasing:
+        df = df.sort_values('Date', kind='stable')
+    for col in df.columns:
+        if col != 'Date' and col not in TEXT_COLUMNS:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+
+def _write_raw_file(dataset, table, version):
+    """Write a versioned raw Parquet file and return its manifest entry"""
+    name = f"{dataset}-{version:08d}.parquet"
+    tmp = SNAPSHOT_DIR / f".{name}.tmp"
+    pq.write_table(table, tmp, row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp, SNAPSHOT_DIR / name)
+    return {'path': name, 'rows': table.num_rows}
+
+
+def _write_raw_snapshot(dataset, csv_file, version):
+    """
+    Parse the complete lines of the ingest CSV into a new versioned Parquet
+    file. Returns (raw entries, bytes of the CSV they hold).
+    """
+    with open(csv_file, 'rb') as f:
+        data = f.read()
+    # A concurrent append may have written part of a line
+    data = data[:data.rfind(b'\n') + 1]
+    if not data:
+        return [], 0
+    df = _parse_csv(data)
+    if df is None or df.empty:
+        return [], len(data)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    return [_write_raw_file(dataset, table, version)], len(data)
+
+
+def _append_raw_delta(dataset, csv_file, snapshot, version):
+    """
+    Parse only the CSV lines appended since the snapshot into a new raw
+    file, merging the small files that trail the snapshot once there are
+    RAW_DELTA_FILES of them. Returns (raw entries, bytes of the CSV they
+    hold), or None when the new rows do not follow the snapshot's in Date
+    order or columns and the whole CSV has to be converted.
+    """
+    raw = snapshot['raw']
+    parsed = snapshot['csv'][0]
+    with open(csv_file, 'rb') as f:
+        header = f.readline()
+        f.seek(parsed)
+        data = f.read()
+    data = data[:data.rfind(b'\n') + 1]
+    if not data:
+        return raw, parsed
+    names = next(csv.reader([header.decode()]))
+    df = _parse_csv(data, names)
+    if df is None:
+        return None
+    if df.empty:
+        return raw, parsed + len(data)
+
+    last = SNAPSHOT_DIR / raw[-1]['path']
+    schema = pq.read_schema(last, memory_map=True)
+    _, newest = history_bounds(last)
+    if newest is not None and df['Date'].iloc[0] < newest:
+        return None
+    if sorted(df.columns) != sorted(schema.names):
+        return None
+    try:
+        table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None
+
+    small = 0
+    while small < len(raw) and raw[len(raw) - 1 - small]['rows'] < ROW_GROUP_SIZE:
+        small += 1
+    if small >= RAW_DELTA_FILES:
+        merged = [pq.read_table(SNAPSHOT_DIR / entry['path'], memory_map=True) for entry in raw[-small:]]
+        table = pa.concat_tables(merged + [table])
+        raw = raw[:-small]
+    return raw + [_write_raw_file(dataset, table, version)], parsed + len(data)
+
+
+def sync_history(dataset='prices', wait=False):
+    """
+    Publish a new snapshot when the dataset's ingest CSV has changed, and
+    return the current manifest. Lines appended since the last snapshot
+    are converted on their own into a new raw file; only a rewritten CSV,
+    or appended rows older than the snapshot's, are converted in full.
+    With wait=False a publish already running in another thread or process
+    is not waited for; the current snapshot is returned instead.
+    """
+    csv_file = DATASETS[dataset]
+    snapshot = current_snapshot(dataset)
+    if snapshot['csv'] == _csv_state(csv_file):
+        return snapshot
+    with snapshot_lock(blocking=wait) as locked:
+        if not locked:
+            return snapshot
+        snapshot = current_snapshot(dataset)
+        state = _csv_state(csv_file)
+        if snapshot['csv'] == state:
+            return snapshot
+        if state is None:
+            return publish_snapshot(dataset, keep_raw=False)
+        version = snapshot['version'] + 1
+        converted = None
+        previous = snapshot['csv']
+        if snapshot['raw'] and previous[2] == state[2] and previous[0] <= state[0]:
+            converted = _append_raw_delta(dataset, csv_file, snapshot, version)
+        if converted is None:
+            converted = _write_raw_snapshot(dataset, csv_file, version)
+        raw, size = converted
+        # The bytes actually parsed, so a later append still counts as a change
+        return publish_snapshot(dataset, raw, [size, state[1], state[2]], keep_raw=False)
+
+
+def history_generation(dataset='prices'):
+    """Number of times the dataset's history has been rebuilt"""
+    return current_snapshot(dataset).get('generation', 0)
+
+
+def snapshot_files(dataset='prices', snapshot=None):
+    """Raw history files of a snapshot (default the current one), in Date order"""
+    snapshot = snapshot or sync_history(dataset)
+    return [SNAPSHOT_DIR / entry['path'] for entry in snapshot['raw']]
+
+
+def rebuild_history(dataset='prices'):
+    """
+    Sort and deduplicate a dataset's ingest CSV in one pass, then publish
+    a new snapshot of the next generation. Used after bulk loads that
+    append older or overlapping rows.
+    Returns the number of rows removed.
+    """
+    def dedup(raw):
+        keys = [c for c in TEXT_COLUMNS if c in raw.columns]
+        raw['_date'] = parse_dates(raw['Date'])
+        return (
+            raw.dropna(subset=['_date'])
+            .sort_values(['_date'] + keys, kind='stable')
+            .drop_duplicates(subset=['_date'] + keys)
+            .drop(columns='_date')
+        )
+
+    with snapshot_lock():
+        removed = rewrite_csv(DATASETS[dataset], dedup)
+        sync_history(dataset, wait=True)
+        publish_snapshot(dataset, rebuilt=True)
+    return removed
+
+
+def _append_lock(csv_file):
+    """Held by appends and by the final step of a rewrite, in any process"""
+    return file_lock(csv_file.with_name(f".{csv_file.name}.lock"))
+
+
+def append_rows(csv_file, fieldnames, rows):
+    """Append rows to an ingest CSV, writing the header for a new file"""
+    with _append_lock(csv_file):
+        new = not csv_file.exists() or csv_file.stat().st_size == 0
+        with open(csv_file, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+            if new:
+                writer.writeheader()
+            writer.writerows(rows)
+
+
+def rewrite_csv(csv_file, transform, size=None):
+    """
+    Replace an ingest CSV with transform(rows), rows read as strings.
+    size: transform only the rows in the first size bytes
+    The file is read and transformed without blocking the writer; lines
+    after them, including any appended in the meantime, are copied over
+    unchanged just before the rename, under the append lock.
+    Returns the number of rows removed.
+    """
+    if not csv_file.exists():
+        return 0
+    with open(csv_file, 'rb') as f:
+        data = f.read(size)
+    # Stop at the last complete line; a partial one is copied with the tail
+    offset = data.rfind(b'\n') + 1
+    if not offset:
+        return 0
+    raw = pd.read_csv(io.BytesIO(data[:offset]), dtype=str)
+    kept = transform(raw)
+
+    tmp = csv_file.with_name(f".{csv_file.name}.tmp")
+    kept.to_csv(tmp, index=False)
+    with _append_lock(csv_file):
+        with open(csv_file, 'rb') as src, open(tmp, 'ab') as dst:
+            src.seek(offset)
+            dst.write(src.read())
+        os.replace(tmp, csv_file)
+    return len(raw) - len(kept)
+
+
+def _row_group_dates(metadata):
+    """(row group, min Date, max Date, rows) from the footer statistics"""
+    date_idx = metadata.schema.to_arrow_schema().get_field_index('Date')
+    groups = []
+    for i in range(metadata.num_row_groups):
+        group = metadata.row_group(i)
+        stats = group.column(date_idx).statistics
+        if stats is not None and stats.has_min_max:
+            groups.append((i, pd.Timestamp(stats.min), pd.Timestamp(stats.max), group.num_rows))
+    return groups
+
+
+def _history_files(history_file):
+    return [history_file] if history_file is not None else snapshot_files('prices')
+
+
+def history_bounds(history_file=None):
+    """
+    Return (min_date, max_date) of the history from the Parquet footer
+    statistics without reading any column data.
+    history_file: default the raw files of the current price snapshot
+    """
+    groups = [
+        group
+        for path in _history_files(history_file)
+        for group in _row_group_dates(pq.ParquetFile(path, memory_map=True).metadata)
+    ]
+    if not groups:
+        return None, None
+    return min(g[1] for g in groups), max(g[2] for g in groups)
+
+
+def load_history(columns=None, start=None, end=None, history_file=None):
+    """
+    Read the price history through a memory map.
+    columns: price columns to read (Date is always included), None for all
+    start/end: optional inclusive time bounds used for row group pruning
+    history_file: default the raw files of the current price snapshot
+    """
+    if history_file is None:
+        return _load_files(snapshot_files('prices'), columns, start, end)
+    if columns is not None:
+        available = pq.read_schema(history_file, memory_map=True).names
+        columns = ['Date'] + [c for c in columns if c != 'Date' and c in available]
+
+    filters = []
+    if start is not None:
+        filters.append(('Date', '>=', pd.Timestamp(start)))
+    if end is not None:
+        filters.append(('Date', '<=', pd.Timestamp(end)))
+
+    table = pq.read_table(
+        history_file,
+        columns=columns,
+        filters=filters or None,
+        memory_map=True,
+    )
+    return table.to_pandas()
+
+
+def _load_files(paths, columns=None, start=None, end=None):
+    """load_history over several files, concatenated in order"""
+    frames = [load_history(columns, start, end, path) for path in paths]
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+# -------------------------------
+# Tiered history
+# -------------------------------
+def catalog_segments(dataset='prices', tier='archive', start=None, end=None, snapshot=None):
+    """Segments of a tier in a snapshot (default the current one) overlapping [start, end]"""
+    snapshot = snapshot or sync_history(dataset)
+    segments = []
+    for seg in snapshot['segments']:
+        if seg['tier'] != tier:
+            continue
+        if start is not None and pd.Timestamp(seg['end']) < pd.Timestamp(start):
+            continue
+        if end is not None and pd.Timestamp(seg['start']) > pd.Timestamp(end):
+            continue
+        segments.append(seg)
+    return sorted(segments, key=lambda seg: seg['start'])
+
+
+def tier_files(dataset='prices', tier='archive', start=None, end=None):
+    """
+    Parquet files holding [start, end] in time order: the overlapping
+    compacted segments of the tier followed by the raw history files, all
+    from the same snapshot
+    """
+    snapshot = sync_history(dataset)
+    files = [SEGMENT_DIR / seg['path'] for seg in catalog_segments(dataset, tier, start, end, snapshot)]
+    return files + snapshot_files(dataset, snapshot)
+
+
+def dataset_bounds(dataset='prices', tier='archive'):
+    """(min_date, max_date) across the compacted segments and the raw history"""
+    snapshot = sync_history(dataset)
+    lows, highs = [], []
+    for seg in catalog_segments(dataset, tier, snapshot=snapshot):
+        lows.append(pd.Timestamp(seg['start']))
+        highs.append(pd.Timestamp(seg['end']))
+    for raw in snapshot_files(dataset, snapshot):
+        low, high = history_bounds(raw)
+        if low is not None:
+            lows.append(low)
+            highs.append(high)
+    if not lows:
+        return None, None
+    return min(lows), max(highs)
+
+
+def load_tiered(dataset='prices', columns=None, start=None, end=None, tier='archive'):
+    """load_history over every file of tier_files, concatenated in time order"""
+    return _load_files(tier_files(dataset, tier, start, end), columns, start, end)
+
+
+def _open_parquet(history_file):
+    """A ParquetFile for a path, or the already open ParquetFile itself"""
+    if isinstance(history_file, pq.ParquetFile):
+        return history_file
+    return pq.ParquetFile(history_file, memory_map=True)
+
+
+def count_rows(start=None, end=None, history_file=None):
+    """
+    Rows in [start, end], reading only the Date column of partial row groups.
+    history_file: a path or an open ParquetFile, default the current snapshot
+    """
+    if history_file is None:
+        return sum(count_rows(start, end, path) for path in snapshot_files('prices'))
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    pf = _open_parquet(history_file)
+    total = 0
+    for group, low, high, rows in _row_group_dates(pf.metadata):
+        if (start is not None and high < start) or (end is not None and low > end):
+            continue
+        if (start is None or low >= start) and (end is None or high <= end):
+            total += rows
+            continue
+        dates = pf.read_row_group(group, columns=['Date']).column('Date').to_pandas()
+        total += int(((start is None or dates >= start) & (end is None or dates <= end)).sum())
+    return total
+
+
+def iter_tiered(dataset='prices', columns=None, start=None, end=None, tier='archive',
+                batch_size=ROW_GROUP_SIZE, skip_rows=0):
+    """iter_history over every file of tier_files, in time order"""
+    yield from _iter_files(tier_files(dataset, tier, start, end), columns, start, end,
+                           batch_size, skip_rows)
+
+
+def _iter_files(paths, columns, start, end, batch_size, skip_rows):
+    """
+    iter_history over several files in order, skipping whole files first.
+    Every file is opened up front: a long stream may outlive
+    SNAPSHOT_GRACE, and an open file survives its removal on POSIX.
+    """
+    files = [_open_parquet(path) for path in paths]
+    for pf in files:
+        if skip_rows:
+            rows = count_rows(start, end, pf)
+            if skip_rows >= rows:
+                skip_rows -= rows
+                continue
+        yield from iter_history(columns, start, end, pf, batch_size, skip_rows)
+        skip_rows = 0
+
+
+# -------------------------------
+# Shared JSON state
+# -------------------------------
+def write_json(path, data):
+    """Write JSON next to the target and rename it into place atomically"""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, 'w') as f:
+        json.dump(data, f, default=str)
+    os.replace(tmp, path)
+
+
+def read_json(path, default=None):
+    """Read a JSON state file, returning default when it does not exist"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def iter_history(columns=None, start=None, end=None, history_file=None,
+                 batch_size=ROW_GROUP_SIZE, skip_rows=0):
+    """
+    Yield the history as pyarrow RecordBatches with bounded memory.
+    columns/start/end: as for load_history
+    history_file: a path or an open ParquetFile, default the current snapshot
+    skip_rows: rows of the filtered result to skip, used to resume exports;
+    row groups that lie entirely inside the window are skipped from their
+    footer row counts without being read
+    """
+    if history_file is None:
+        yield from _iter_files(snapshot_files('prices'), columns, start, end, batch_size, skip_rows)
+        return
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    pf = _open_parquet(history_file)
+    if columns is not None:
+        available = pf.schema_arrow.names
+        columns = ['Date'] + [c for c in columns if c != 'Date' and c in available]
+
+    for group, low, high, rows in _row_group_dates(pf.metadata):
+        if (start is not None and high < start) or (end is not None and low > end):
+            continue
+        inside = (start is None or low >= start) and (end is None or high <= end)
+        if inside and skip_rows >= rows:
+            skip_rows -= rows
+            continue
+
+        for batch in pf.iter_batches(batch_size=batch_size, row_groups=[group], columns=columns):
+            if not inside:
+                dates = batch.column('Date')
+                mask = None
+                if start is not None:
+                    mask = pc.greater_equal(dates, pa.scalar(start.to_datetime64(), dates.type))
+                if end is not None:
+                    upper = pc.less_equal(dates, pa.scalar(end.to_datetime64(), dates.type))
+                    mask = upper if mask is None else pc.and_(mask, upper)
+                batch = batch.filter(mask)
+            if skip_rows:
+                dropped = min(skip_rows, batch.num_rows)
+                batch = batch.slice(dropped)
+                skip_rows -= dropped
+            if batch.num_rows:
+                yield batch
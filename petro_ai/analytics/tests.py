@@ -1,3 +1,961 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import multiprocessing as mp
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.test import SimpleTestCase
+
+from . import (
+    anomaly, backtest, export, indicators, ingest, insights, maintenance, mqtt_client, replay, retention,
+    storage, views,
+)
+from .ingest import PRICE_FIELDS
+from .reorder import ReorderBuffer, parse_timestamp
+from .simulator import Collector
 
 # Create your tests here.
+
+
+class ReorderBufferTest(SimpleTestCase):
+    BASE = datetime(2024, 1, 1, 10, 0, 0)
+
+    def setUp(self):
+        # Wall clock a minute after the first tick
+        self.buffer = ReorderBuffer(lateness=5.0, max_hold=10.0, max_future=5.0,
+                                    clock=lambda: (self.BASE + timedelta(minutes=1)).timestamp())
+
+    def push(self, seconds, now=0.0, series='prices'):
+        ts = self.BASE + timedelta(seconds=seconds)
+        accepted, released = self.buffer.push(series, ts, {'s': seconds}, now=now)
+        return accepted, [row['s'] for row in released]
+
+    def test_releases_in_order_behind_watermark(self):
+        self.assertEqual(self.push(2), (True, []))
+        self.assertEqual(self.push(0), (True, []))
+        self.assertEqual(self.push(1), (True, []))
+        self.assertEqual(self.push(7), (True, [0, 1, 2]))
+
+    def test_drops_late_ticks(self):
+        self.push(0)
+        self.push(10)
+        self.assertEqual(self.push(20), (True, [10]))
+        self.assertEqual(self.push(3), (False, []))
+        self.assertEqual(self.buffer.stats['late'], 1)
+
+    def test_drops_duplicates(self):
+        self.push(0)
+        self.assertEqual(self.push(0), (False, []))
+        self.push(10)
+        # Also after the first copy was released
+        self.assertEqual(self.push(0), (False, []))
+        # Another series at the same timestamp is not a duplicate
+        self.assertEqual(self.push(0, series='other'), (True, [0]))
+        self.assertEqual(self.buffer.stats['duplicates'], 2)
+
+    def test_expires_held_ticks(self):
+        self.push(0, now=0.0)
+        self.assertEqual([r['s'] for r in self.buffer.expire(now=5.0)], [])
+        self.assertEqual([r['s'] for r in self.buffer.expire(now=10.0)], [0])
+
+    def test_rejects_future_ticks(self):
+        self.push(0)
+        far = self.BASE.replace(year=2099)
+        accepted, released = self.buffer.push('prices', far, {'s': 'far'}, now=20.0)
+        self.assertEqual((accepted, released), (False, [{'s': 0}]))
+        self.assertEqual(self.buffer.stats['future'], 1)
+        # Ticks after it are not counted as late
+        self.assertEqual(self.push(30, now=20.0), (True, []))
+        self.assertEqual(self.push(40, now=20.0), (True, [30]))
+
+    def test_mixes_offset_aware_and_naive_dates(self):
+        aware = parse_timestamp('2024-01-01T10:00:40+00:00')
+        local = datetime(2024, 1, 1, 10, 0, 40, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+        self.assertEqual(aware, local)
+        buffer = ReorderBuffer(clock=lambda: local.timestamp())
+        self.assertTrue(buffer.push('prices', local - timedelta(seconds=1), {})[0])
+        self.assertTrue(buffer.push('prices', aware, {})[0])
+
+    def test_rejects_invalid_dates(self):
+        for value in (None, '', 'n/a', [1], '0001-01-01'):
+            self.assertIsNone(parse_timestamp(value))
+        self.assertEqual(self.buffer.push('prices', parse_timestamp('n/a'), {}), (False, []))
+
+
+def _rows(start, count, freq):
+    base = pd.Timestamp("2024-01-01")
+    return [
+        {'Date': str(base + i * pd.Timedelta(freq)), 'Brent': i, 'WTI': i, 'NaturalGas': i}
+        for i in range(start, start + count)
+    ]
+
+
+def _append_in_process(directory, start, stop, batch_rows, freq):
+    """Writer of the multi-process test; runs in a spawned process"""
+    os.chdir(directory)
+    for first in range(start, stop, batch_rows):
+        storage.append_rows(storage.REALTIME_FILE, PRICE_FIELDS,
+                            _rows(first, min(batch_rows, stop - first), freq))
+
+
+class MixedTimezoneIngestTest(SimpleTestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("analytics")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_aware_ticks_are_stored_as_local_time(self):
+        now = datetime.now().replace(microsecond=0)
+        dates = [
+            str(now - timedelta(seconds=12)),
+            (now - timedelta(seconds=8)).astimezone(timezone.utc).isoformat(),
+            (now - timedelta(seconds=4)).astimezone(timezone(timedelta(hours=-5))).isoformat(),
+            str(now - timedelta(seconds=2)),
+        ]
+        with mock.patch.object(mqtt_client, 'price_buffer', ReorderBuffer()), \
+                mock.patch('builtins.print'):
+            for i, date in enumerate(dates):
+                payload = {'Date': date, 'Brent': 70 + i, 'WTI': 65 + i, 'NaturalGas': 2 + i}
+                mqtt_client.on_message(None, None, SimpleNamespace(
+                    topic=mqtt_client.PRICE_TOPIC, payload=json.dumps(payload).encode()))
+            mqtt_client.write_prices(mqtt_client.price_buffer.flush())
+
+        df = views.load_or_generate_data('today')
+        self.assertEqual(df['Brent'].tolist(), [70, 71, 72, 73])
+        expected = [now - timedelta(seconds=s) for s in (12, 8, 4, 2)]
+        self.assertEqual(df['Date'].tolist(), [pd.Timestamp(d) for d in expected])
+
+    def test_legacy_mixed_rows_still_convert(self):
+        now = datetime.now().replace(microsecond=0)
+        rows = [
+            {'Date': str(now - timedelta(days=10)), 'Brent': 1, 'WTI': 1, 'NaturalGas': 1},
+            {'Date': (now - timedelta(days=9)).astimezone(timezone.utc).isoformat(),
+             'Brent': 2, 'WTI': 2, 'NaturalGas': 2},
+            {'Date': str(now - timedelta(hours=1)), 'Brent': 3, 'WTI': 3, 'NaturalGas': 3},
+        ]
+        storage.append_rows(storage.REALTIME_FILE, PRICE_FIELDS, rows)
+        self.assertEqual(storage.load_history()['Brent'].tolist(), [1, 2, 3])
+
+        summary = retention.compact('prices', raw_days=7, archive_days=10_000)
+        self.assertEqual(summary['archived_rows'], 2)
+        self.assertEqual(storage.load_history()['Brent'].tolist(), [3])
+
+
+class StreamingDetectorTest(SimpleTestCase):
+    # Alerts before this sample come from the warm-up and are ignored
+    SETTLED = 100
+
+    def setUp(self):
+        self.noise = np.random.default_rng(7).normal(0, 1, 3000)
+
+    def run_series(self, values):
+        detector = anomaly.StreamingDetector()
+        alerts = {}
+        for i, value in enumerate(values):
+            for _, reasons, _ in detector.update([('Pump-1', 'Pressure')], [value]):
+                alerts[i] = reasons
+        return {i: reasons for i, reasons in alerts.items() if i >= self.SETTLED}
+
+    def test_isolated_spike_is_flagged_once(self):
+        values = 100 + self.noise[:500]
+        values[300] = 160
+        alerts = self.run_series(values)
+        self.assertEqual(list(alerts), [300])
+        self.assertIn('rate_of_change', alerts[300])
+
+    def test_level_shift_settles(self):
+        values = np.r_[100 + self.noise[:500], 140 + self.noise[500:2500]]
+        alerts = self.run_series(values)
+        self.assertIn(500, alerts)
+        roc = [i for i, reasons in alerts.items() if 'rate_of_change' in reasons]
+        self.assertEqual(roc, list(range(500, 500 + anomaly.SHIFT_CONFIRM)))
+        self.assertLess(max(alerts), 600)
+
+    def test_stop_to_zero_settles(self):
+        values = np.r_[100 + self.noise[:500], 0.01 * self.noise[500:1500]]
+        self.assertLess(max(self.run_series(values)), 600)
+
+    def test_nan_values_are_skipped(self):
+        values = 100 + self.noise[:500]
+        with_gaps = values.copy()
+        with_gaps[::7] = np.nan
+        clean = self.run_series(values[np.isfinite(with_gaps)])
+        gaps = self.run_series(with_gaps)
+        positions = np.flatnonzero(np.isfinite(with_gaps))
+        self.assertEqual(sorted(gaps), sorted(int(positions[i]) for i in clean))
+
+    def test_repeated_series_in_one_batch_matches_sequential(self):
+        keys = [('Pump-1', 'Pressure'), ('Pump-2', 'Pressure'), ('Pump-1', 'Pressure')]
+        values = np.c_[100 + self.noise[:400], 50 + self.noise[400:800], 100 + self.noise[800:1200]]
+        values[300, 2] = 160
+
+        batched = anomaly.StreamingDetector()
+        sequential = anomaly.StreamingDetector()
+        for row in values:
+            flagged = [(keys[pos], reasons) for pos, reasons, _ in batched.update(keys, row)]
+            expected = []
+            for key, value in zip(keys, row):
+                expected.extend((key, reasons) for _, reasons, _ in sequential.update([key], [value]))
+            self.assertEqual(flagged, expected)
+        np.testing.assert_array_equal(batched.median, sequential.median)
+        np.testing.assert_array_equal(batched.last, sequential.last)
+
+
+class AlertPublisherTest(SimpleTestCase):
+    @staticmethod
+    def alert(asset, date, score=5.0):
+        return {'asset': asset, 'metric': 'Pressure', 'date': str(date), 'value': 1.0,
+                'checks': ['robust_z'], 'score': score}
+
+    def test_replayed_alerts_merge_with_live_alerts(self):
+        now = datetime.now()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'alerts.json'
+            live = anomaly.AlertPublisher(path)
+            live.add([self.alert('Pump-1', now)])
+            live.publish()
+
+            # A replay process publishes alerts from months-old history
+            replay = anomaly.AlertPublisher(path)
+            replay.add([self.alert('Pump-2', now - timedelta(days=90 + i)) for i in range(3)])
+            replay.publish(force=True)
+
+            live.add([self.alert('Pump-1', now)])
+            live.publish()
+            data = storage.read_json(path)
+
+        self.assertEqual([a['asset'] for a in data['alerts']], ['Pump-1'] * 2 + ['Pump-2'] * 3)
+        self.assertAlmostEqual(data['asset_scores']['Pump-1'], 10.0, places=1)
+        self.assertEqual(data['asset_scores']['Pump-2'], 0.0)
+
+
+class CollectorTest(SimpleTestCase):
+    def test_latency_samples_stay_bounded(self):
+        handled = []
+        collector = Collector(lambda topic, payload: handled.append(payload), samples=100)
+        now = time.time()
+        for i in range(10000):
+            collector.receive('oil_gas/sensors', json.dumps({'ts': now - i / 1000, 'i': i}))
+
+        self.assertEqual(collector.received, 10000)
+        self.assertEqual(len(collector.latencies), 100)
+        self.assertNotIn('ts', handled[0])
+        summary = collector.summary()
+        # A uniform sample of 0..10s latencies
+        self.assertGreater(summary['latency_ms_p50'], 3000)
+        self.assertLess(summary['latency_ms_p50'], 7000)
+        self.assertGreaterEqual(summary['latency_ms_max'], 9999)
+
+
+class InsightsTest(SimpleTestCase):
+    def test_market_publish_keeps_maintenance_risk(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            market_file = Path(tmp) / 'insights.json'
+            risk_file = Path(tmp) / 'risk.json'
+            insights.update_maintenance([
+                {'asset_id': f'Pump-{i}', 'metric': 'Vibration', 'health_score': 50,
+                 'predicted_failure': i / 10}
+                for i in range(1, 6)
+            ], path=risk_file)
+
+            # The ingest process republishes its market state afterwards
+            engine = insights.InsightsEngine()
+            engine.ingest(_rows(1, 40, '1min'))
+            engine.publish(market_file)
+
+            data = insights.load_insights(market_file, risk_file)
+            titles = [i['title'] for i in data['insights']]
+            self.assertIn('Maintenance Risk #1: Pump-5', titles)
+            self.assertTrue(any('Trend' in title for title in titles))
+            self.assertEqual(data['total_insights'], len(titles))
+
+
+class InsightsReloadTest(SimpleTestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("analytics")
+        patches = [mock.patch.object(insights, '_engine', None), mock.patch.object(insights, '_cache', {})]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_rebuilt_history_reloads_the_engine(self):
+        ingest.ingest_batch('prices', _rows(100, 30, '1min'), check=lambda samples: [])
+        live = insights._engine
+        self.assertEqual(live.series['Brent'].ticks, 30)
+        self.assertEqual(storage.read_json(insights.INSIGHTS_FILE)['generation'], 0)
+
+        # A bulk load appends older and overlapping rows, then rebuilds
+        storage.append_rows(storage.REALTIME_FILE, PRICE_FIELDS, _rows(0, 130, '1min'))
+        self.assertEqual(storage.rebuild_history('prices'), 30)
+        self.assertEqual(storage.history_generation('prices'), 1)
+
+        # Readers do not trust insights published from the old history
+        insights.load_insights()
+        self.assertIsNot(insights._engine, live)
+        self.assertEqual(insights._engine.series['Brent'].ticks, 130)
+
+        # The live engine starts over on its next tick, which is read from
+        # the history rather than ingested twice
+        insights._engine = live
+        ingest.ingest_batch('prices', _rows(130, 5, '1min'), check=lambda samples: [])
+        self.assertEqual(insights._engine.generation, 1)
+        self.assertEqual(insights._engine.series['Brent'].ticks, 135)
+        self.assertEqual(insights._engine.series['Brent'].last, 134)
+        self.assertEqual(storage.read_json(insights.INSIGHTS_FILE)['generation'], 1)
+
+
+class BacktestTest(SimpleTestCase):
+    PATTERN = np.array([5.0, 6.0, 8.0, 7.0, 9.0, 4.0, 3.0])
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("analytics")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def series(self, n):
+        dates = pd.date_range("2024-01-01", periods=n, freq='1D').to_numpy()
+        values = np.tile(self.PATTERN, n // 7 + 1)[:n] + np.arange(n) * 0.1
+        return {'Brent': (dates, values)}
+
+    def test_fold_origins(self):
+        self.assertEqual(backtest.fold_origins(30, 5, 10, 5, 0), [10, 15, 20, 25])
+        self.assertEqual(backtest.fold_origins(30, 5, 10, 5, 2), [20, 25])
+        self.assertEqual(backtest.fold_origins(29, 5, 10, 5, 0), [10, 15, 20])
+        self.assertEqual(backtest.fold_origins(12, 5, 10, 5, 0), [])
+
+    def test_seasonal_naive_repeats_the_last_season(self):
+        y = np.tile(self.PATTERN, 4)[:26]
+        yhat, lower, upper = backtest.seasonal_naive(None, y, 10, 0.8, 7, '1D')
+        np.testing.assert_array_equal(yhat, np.tile(self.PATTERN, 6)[26:36])
+        # A series that repeats exactly has no seasonal error
+        np.testing.assert_array_equal(lower, yhat)
+        np.testing.assert_array_equal(upper, yhat)
+
+        # Too short for a season: falls back to the last value
+        yhat, _, _ = backtest.seasonal_naive(None, y[:8], 3, 0.8, 7, '1D')
+        np.testing.assert_array_equal(yhat, [y[7]] * 3)
+
+    def test_score_pools_the_points_of_all_folds(self):
+        fits = [
+            {'yhat': [1.0, 2.0], 'lower': [0.0, 1.0], 'upper': [2.0, 3.0]},
+            {'yhat': [4.0], 'lower': [3.5], 'upper': [4.5]},
+        ]
+        score = backtest._score(fits, [np.array([2.0, 4.0]), np.array([0.0])])
+        self.assertAlmostEqual(score['mae'], 7 / 3)
+        # The zero actual counts for MAE and coverage but not for MAPE
+        self.assertAlmostEqual(score['mape'], 50.0)
+        self.assertAlmostEqual(score['coverage'], 1 / 3)
+        self.assertEqual(score['points'], 3)
+
+    def test_recommend_picks_the_cheapest_good_enough_model(self):
+        summary = [
+            {'model': 'slow', 'mape': 10.0, 'fit_seconds': 5.0},
+            {'model': 'fast', 'mape': 10.5, 'fit_seconds': 1.0},
+            {'model': 'fastest', 'mape': 12.0, 'fit_seconds': 0.1},
+            {'model': 'unscored', 'mape': None, 'fit_seconds': 0.0},
+        ]
+        self.assertEqual(backtest.recommend(summary), 'fast')
+        self.assertEqual(backtest.recommend(summary, tolerance=1.0), 'slow')
+        self.assertIsNone(backtest.recommend(summary[3:]))
+
+    def test_rerun_fits_only_new_folds(self):
+        options = dict(models=['naive', 'seasonal_naive', 'exp_smoothing'], horizon=5, initial=20,
+                       step=5, max_folds=0, workers=1)
+        first = backtest.run_backtest(series=self.series(60), **options)
+        self.assertEqual(first['fitted_folds'], 3 * 8)
+        self.assertEqual(first['recommended'], 'seasonal_naive')
+
+        again = backtest.run_backtest(series=self.series(60), **options)
+        self.assertEqual(again['fitted_folds'], 0)
+        self.assertTrue(all(row['cached'] == row['folds'] == 8 for row in again['series']))
+        for row, cached in zip(first['series'], again['series']):
+            self.assertEqual(row['mae'], cached['mae'])
+
+        # New data adds one fold per model; the earlier ones keep their keys
+        grown = backtest.run_backtest(series=self.series(65), **options)
+        self.assertEqual(grown['fitted_folds'], 3)
+        self.assertEqual(storage.read_json(backtest.REPORT_FILE)['fitted_folds'], 3)
+
+
+class IndicatorsTest(SimpleTestCase):
+    WINDOW = 5
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("analytics")
+        rng = np.random.default_rng(7)
+        brent = 80 + np.cumsum(rng.normal(0, 1, 120))
+        self.df = pd.DataFrame({
+            'Date': pd.date_range("2024-01-01", periods=120, freq='1min'),
+            'Brent': brent,
+            'WTI': brent - 4 + rng.normal(0, 0.5, 120),
+        })
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def one_shot(self, name, df):
+        columns = list(indicators.CORRELATION_PAIR) if name == 'corr' else ['Brent']
+        return indicators.KERNELS[name](self.WINDOW).update(*(df[c].to_numpy() for c in columns))
+
+    def reference(self, name):
+        """The same indicators computed with pandas"""
+        w = self.WINDOW
+        s = self.df['Brent']
+        if name == 'sma':
+            return {'SMA': s.rolling(w).mean()}
+        if name == 'ema':
+            return {'EMA': s.ewm(span=w, adjust=False).mean().where(s.index >= w - 1)}
+        if name == 'bollinger':
+            mean, std = s.rolling(w).mean(), s.rolling(w).std(ddof=0)
+            return {'BB mid': mean, 'BB upper': mean + 2 * std, 'BB lower': mean - 2 * std}
+        if name == 'corr':
+            return {'Corr': s.rolling(w).corr(self.df['WTI'])}
+        change = s.diff()
+        if name == 'atr':
+            out = {'ATR': change.abs().ewm(alpha=1 / w, adjust=False).mean()}
+        else:
+            gain = change.clip(lower=0).ewm(alpha=1 / w, adjust=False).mean()
+            loss = (-change).clip(lower=0).ewm(alpha=1 / w, adjust=False).mean()
+            out = {'RSI': 100 - 100 / (1 + gain / loss)}
+        return {label: values.where(s.index >= w) for label, values in out.items()}
+
+    def test_incremental_kernels_match_one_shot_and_pandas(self):
+        cuts = [0, 1, 8, 11, 60, 61, 120]
+        for name in indicators.KERNELS:
+            with self.subTest(name=name):
+                whole = self.one_shot(name, self.df)
+                kernel = indicators.KERNELS[name](self.WINDOW)
+                columns = list(indicators.CORRELATION_PAIR) if name == 'corr' else ['Brent']
+                parts = [
+                    kernel.update(*(self.df[c].to_numpy()[a:b] for c in columns))
+                    for a, b in zip(cuts, cuts[1:])
+                ]
+                for label, expected in self.reference(name).items():
+                    incremental = np.concatenate([part[label] for part in parts])
+                    np.testing.assert_allclose(incremental, whole[label], rtol=1e-9)
+                    np.testing.assert_allclose(whole[label], expected.to_numpy(), rtol=1e-6, atol=1e-6)
+
+    def test_cache_feeds_only_new_rows_and_slices_narrower_windows(self):
+        cache = indicators.IndicatorCache()
+        specs = [('sma', self.WINDOW)]
+        expected = self.one_shot('sma', self.df)['SMA']
+
+        indicators.compute_indicators(self.df.iloc[:60], specs, cache)
+        kernel = cache.entries[('sma', self.WINDOW, ('Brent',))].kernel
+        with mock.patch.object(kernel, 'update', wraps=kernel.update) as update:
+            # Brent comes first, then WTI
+            values = indicators.compute_indicators(self.df, specs, cache)[0][2]
+            self.assertEqual([len(call.args[0]) for call in update.call_args_list], [60])
+            np.testing.assert_allclose(values, expected)
+
+            values = indicators.compute_indicators(self.df.iloc[30:90], specs, cache)[0][2]
+            self.assertEqual(update.call_count, 1)
+            np.testing.assert_allclose(values, expected[30:90])
+
+    def test_catalog_generation_change_rebuilds_entries(self):
+        cache = indicators.IndicatorCache()
+        specs = [('sma', self.WINDOW)]
+        storage.CATALOG_FILE.parent.mkdir(parents=True)
+        storage.write_json(storage.CATALOG_FILE, {'segments': []})
+        indicators.compute_indicators(self.df, specs, cache)
+
+        # Compaction rewrites the stored history under the same dates
+        rewritten = self.df.assign(Brent=self.df['Brent'] + 1)
+        stale = indicators.compute_indicators(rewritten, specs, cache)[0][2]
+        np.testing.assert_allclose(stale, self.one_shot('sma', self.df)['SMA'])
+
+        mtime = storage.CATALOG_FILE.stat().st_mtime_ns + 1_000_000_000
+        os.utime(storage.CATALOG_FILE, ns=(mtime, mtime))
+        fresh = indicators.compute_indicators(rewritten, specs, cache)[0][2]
+        np.testing.assert_allclose(fresh, self.one_shot('sma', rewritten)['SMA'])
+
+
+class MaintenanceIndexTest(SimpleTestCase):
+    def setUp(self):
+        # Few distinct values, so every sort has ties broken by asset id
+        records = []
+        for i in range(23):
+            prob = [0.05, 0.15, 0.25][i % 3]
+            records.append({
+                'asset_id': f'Pump-{i:02d}',
+                'metric': maintenance.METRICS[i % 2],
+                'current_value': float(i % 4),
+                'predicted_failure': prob,
+                'health_score': 100 - prob * 100,
+                'status': maintenance.STATUSES[2 - i % 3],
+                'last_update': f'{i % 5:02d}:00:00',
+            })
+        self.index = maintenance.MaintenanceIndex(records, version=1)
+
+    def pages(self, sort, order, status):
+        seen, cursor = [], None
+        while True:
+            rows, token = self.index.query(sort=sort, order=order, status=status,
+                                           cursor=cursor, limit=4)
+            seen.extend(rows)
+            if token is None:
+                return seen
+            cursor = maintenance.decode_cursor(token, sort, order)
+
+    def test_keyset_pages_return_every_row_once(self):
+        for sort, key in maintenance.SORT_FIELDS.items():
+            for order in ('asc', 'desc'):
+                for status in (None, 'Warning'):
+                    with self.subTest(sort=sort, order=order, status=status):
+                        expected = [r for r in self.index.records if status in (None, r['status'])]
+                        expected.sort(key=lambda r: (key(r), r['asset_id']), reverse=order == 'desc')
+                        seen = self.pages(sort, order, status)
+                        self.assertEqual([r['asset_id'] for r in seen],
+                                         [r['asset_id'] for r in expected])
+
+    def test_decode_cursor_rejects_foreign_and_malformed_cursors(self):
+        _, token = self.index.query(sort='health_score', order='asc', limit=2)
+        self.assertEqual(maintenance.decode_cursor(token, 'health_score', 'asc')['version'], 1)
+        with self.assertRaisesMessage(ValueError, 'different sort order'):
+            maintenance.decode_cursor(token, 'health_score', 'desc')
+        with self.assertRaisesMessage(ValueError, 'different sort order'):
+            maintenance.decode_cursor(token, 'predicted_failure', 'asc')
+        forged = [
+            'not a cursor',
+            maintenance.encode_cursor('health_score', 'asc', 1, ['abc', 'Pump-01']),
+            maintenance.encode_cursor('health_score', 'asc', 1, [True, 'Pump-01']),
+            maintenance.encode_cursor('health_score', 'asc', '1', [50.0, 'Pump-01']),
+            maintenance.encode_cursor('health_score', 'asc', 1, [50.0]),
+            maintenance.encode_cursor('no_such_field', 'asc', 1, [50.0, 'Pump-01']),
+        ]
+        for token in forged:
+            with self.subTest(token=token), self.assertRaisesMessage(ValueError, 'invalid cursor'):
+                maintenance.decode_cursor(token, 'health_score', 'asc')
+
+
+class ExportTest(SimpleTestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("analytics")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    @staticmethod
+    def frame(count=200):
+        dates = pd.date_range("2024-01-01", periods=count, freq='10min')
+        values = np.arange(count, dtype=float)
+        return pd.DataFrame({'Date': dates, 'Brent': values, 'WTI': values * 2, 'NaturalGas': values / 10})
+
+    def test_offset_resumes_across_archive_and_raw_files(self):
+        # Ten days of ticks, the first seven compacted into the archive tier
+        storage.append_rows(storage.REALTIME_FILE, PRICE_FIELDS, _rows(0, 6 * 24 * 10, '10min'))
+        retention.compact('prices', raw_days=3, archive_days=10_000, now=pd.Timestamp("2024-01-10"))
+        self.assertTrue(storage.catalog_segments('prices'))
+
+        with mock.patch.object(export, 'EXPORT_BATCH_ROWS', 100):
+            for resolution in (None, '1h'):
+                full = pd.concat(export.iter_frames('prices', resolution=resolution), ignore_index=True)
+                archived = len(storage.load_history(history_file=storage.tier_files('prices')[0]))
+                for offset in (0, 1, 99, 100, archived - 1, archived, archived + 7, len(full) - 1, len(full)):
+                    with self.subTest(resolution=resolution, offset=offset):
+                        frames = list(export.iter_frames('prices', resolution=resolution, skip_rows=offset))
+                        resumed = pd.concat(frames, ignore_index=True) if frames else full.iloc[:0]
+                        pd.testing.assert_frame_equal(resumed, full.iloc[offset:].reset_index(drop=True))
+
+    def test_resample_carries_buckets_across_batches(self):
+        df = self.frame()
+        df['Asset'] = np.where(np.arange(len(df)) % 3, 'Pump-1', 'Pump-2')
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        batches = table.to_batches(max_chunksize=7)
+
+        for group_by in ([], ['Asset']):
+            with self.subTest(group_by=group_by):
+                frames = export._resample(batches, '1h', group_by)
+                got = pd.concat(frames, ignore_index=True)
+                expected = (
+                    df.drop(columns=[] if group_by else ['Asset'])
+                    .assign(Date=df['Date'].dt.floor('1h'))
+                    .groupby(['Date'] + group_by).mean().reset_index()
+                )
+                pd.testing.assert_frame_equal(got, expected)
+
+    def test_chunked_encoders_match_one_shot_output(self):
+        df = self.frame()
+        frames = [df.iloc[:70], df.iloc[70:71], df.iloc[71:]]
+
+        csv_body = b''.join(export.stream_export(iter(frames), 'csv'))
+        self.assertEqual(csv_body, df.to_csv(index=False, date_format='%Y-%m-%d %H:%M:%S.%f').encode())
+        gz_body = b''.join(export.stream_export(iter(frames), 'csv', 'gzip'))
+        self.assertEqual(gzip.decompress(gz_body), csv_body)
+
+        ndjson = b''.join(export.stream_export(iter(frames), 'ndjson')).decode().splitlines()
+        self.assertEqual(len(ndjson), len(df))
+        self.assertEqual(json.loads(ndjson[70])['Brent'], 70.0)
+
+        chunks = list(export.stream_export(iter(frames), 'parquet', 'gzip'))
+        self.assertGreater(len(chunks), 1)
+        table = pq.read_table(io.BytesIO(b''.join(chunks)))
+        pd.testing.assert_frame_equal(table.to_pandas(), df, check_dtype=False)
+
+    def test_offset_aware_bounds_are_checked_before_streaming(self):
+        storage.append_rows(storage.REALTIME_FILE, PRICE_FIELDS, _rows(0, 100, '10min'))
+        response = self.client.get('/api/export/', {'start': '2023-12-31T00:00:00Z',
+                                                    'end': '2024-01-03T00:00:00+05:00'})
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content)
+        self.assertEqual(body.count(b'\n'), 101)
+        response = self.client.get('/api/export/', {'start': 'yesterday-ish'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_empty_parquet_export_is_a_valid_file(self):
+        schema = export.empty_schema('sensors', ['Pressure'])
+        body = b''.join(export.stream_export(iter([]), 'parquet', None, schema))
+        table = pq.read_table(io.BytesIO(body))
+        self.assertEqual(table.num_rows, 0)
+        self.assertEqual(table.schema.names, ['Date', 'Asset', 'Pressure'])
+
+
+class RetentionTest(SimpleTestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("analytics")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_hourly_runs_merge_into_monthly_segments(self):
+        # Ticks every 10 minutes through January, compacted every hour
+        storage.append_rows(storage.REALTIME_FILE, PRICE_FIELDS, _rows(0, 6 * 24 * 31, '10min'))
+        start = pd.Timestamp("2024-01-08 00:25")
+        for hour in range(48):
+            retention.compact('prices', raw_days=7, archive_days=10_000,
+                              now=start + pd.Timedelta(hours=hour))
+
+        segments = storage.current_snapshot('prices')['segments']
+        self.assertEqual(sorted(seg['tier'] for seg in segments), ['archive', 'rollup'])
+        archive = storage.load_tiered('prices')
+        np.testing.assert_array_equal(archive['Brent'].to_numpy(), np.arange(len(archive)))
+        rollup = storage.load_tiered('prices', tier='rollup')
+        self.assertFalse(rollup['Date'].duplicated().any())
+        # Every hourly bucket before the last cutoff holds the mean of all six ticks
+        archived = rollup[rollup['Date'] < pd.Timestamp("2024-01-02 23:00")]
+        self.assertEqual(len(archived), 47)
+        np.testing.assert_allclose(archived['Brent'].to_numpy(), np.arange(len(archived)) * 6 + 2.5)
+
+
+class SnapshotSyncTest(SimpleTestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("analytics")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_streams_outlive_retired_files(self):
+        storage.append_rows(storage.REALTIME_FILE, PRICE_FIELDS, _rows(0, 6 * 24 * 10, '10min'))
+        retention.compact('prices', raw_days=3, archive_days=10_000, now=pd.Timestamp("2024-01-10"))
+        storage.append_rows(storage.REALTIME_FILE, PRICE_FIELDS, _rows(6 * 24 * 10, 10, '10min'))
+        expected = storage.load_tiered('prices')
+        self.assertGreater(len(storage.tier_files('prices')), 2)
+
+        stream = storage.iter_tiered('prices', batch_size=50)
+        batches = [next(stream)]
+        # The grace period runs out while the stream is still being read
+        for path in [*storage.SNAPSHOT_DIR.glob('*.parquet'), *storage.SEGMENT_DIR.rglob('*.parquet')]:
+            path.unlink()
+        batches.extend(stream)
+        got = pa.Table.from_batches(batches).to_pandas()
+        pd.testing.assert_frame_equal(got, expected)
+
+    def test_appends_are_converted_incrementally(self):
+        storage.append_rows(storage.REALTIME_FILE, PRICE_FIELDS, _rows(0, 1000, '1s'))
+        raw = storage.sync_history()['raw']
+        merges = 0
+        for i in range(1000, 1000 + storage.RAW_DELTA_FILES + 4):
+            storage.append_rows(storage.REALTIME_FILE, PRICE_FIELDS, _rows(i, 1, '1s'))
+            previous, raw = raw, storage.sync_history()['raw']
+            # Each append adds one file, until the small files are merged
+            if len(raw) == 1:
+                merges += 1
+            else:
+                self.assertEqual(raw[:-1], previous)
+                self.assertEqual(raw[-1]['rows'], 1)
+        self.assertEqual(merges, 1)
+        history = storage.load_history()
+        np.testing.assert_array_equal(history['Brent'].to_numpy(), np.arange(len(history)))
+        self.assertEqual(storage.count_rows(), 1000 + storage.RAW_DELTA_FILES + 4)
+
+        # An older row can only be placed by converting the whole CSV
+        storage.append_rows(storage.REALTIME_FILE, PRICE_FIELDS, _rows(500, 1, '1s'))
+        raw = storage.sync_history()['raw']
+        self.assertEqual(len(raw), 1)
+        self.assertTrue(storage.load_history()['Date'].is_monotonic_increasing)
+
+
+class SnapshotStressTest(SimpleTestCase):
+    """Readers racing the writer and compaction must only see whole snapshots"""
+
+    WRITE_BATCHES = 200
+    BATCH_ROWS = 20
+    READERS = 4
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("analytics")
+        self.errors = []
+        self.done = threading.Event()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def rows(self, start, count, freq):
+        return _rows(start, count, freq)
+
+    def run_readers(self, check):
+        def loop():
+            try:
+                while not self.done.is_set():
+                    check()
+            except Exception as exc:
+                self.errors.append(exc)
+                self.done.set()
+
+        threads = [threading.Thread(target=loop) for _ in range(self.READERS)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def check_prefix(self, seen, df):
+        """Rows form 0..n-1 with nothing torn, duplicated or missing"""
+        brent = df['Brent'].to_numpy() if not df.empty else np.empty(0)
+        np.testing.assert_array_equal(brent, np.arange(len(brent)))
+        self.assertGreaterEqual(len(brent), seen)
+        return len(brent)
+
+    def test_readers_see_whole_appends(self):
+        seen = threading.local()
+
+        def check():
+            seen.rows = self.check_prefix(getattr(seen, 'rows', 0), storage.load_tiered('prices'))
+            low, high = storage.dataset_bounds('prices')
+            if low is not None:
+                self.assertEqual(low, pd.Timestamp("2024-01-01"))
+
+        readers = self.run_readers(check)
+        for batch in range(self.WRITE_BATCHES):
+            storage.append_rows(storage.REALTIME_FILE, PRICE_FIELDS,
+                                self.rows(batch * self.BATCH_ROWS, self.BATCH_ROWS, '1s'))
+            time.sleep(0.005)
+            if self.done.is_set():
+                break
+        time.sleep(0.2)
+        self.done.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(self.errors, [])
+        storage.sync_history(wait=True)
+        self.assertEqual(len(storage.load_tiered('prices')), self.WRITE_BATCHES * self.BATCH_ROWS)
+
+    def test_compaction_keeps_every_row_once(self):
+        seen = threading.local()
+
+        def check():
+            seen.rows = self.check_prefix(getattr(seen, 'rows', 0), storage.load_tiered('prices'))
+
+        # Ticks an hour apart, compacted while more are appended
+        storage.append_rows(storage.REALTIME_FILE, PRICE_FIELDS, self.rows(0, 24 * 40, '1h'))
+        readers = self.run_readers(check)
+        writer_rows = [24 * 40]
+
+        def write():
+            while not self.done.is_set() and writer_rows[0] < 24 * 120:
+                storage.append_rows(storage.REALTIME_FILE, PRICE_FIELDS, self.rows(writer_rows[0], 12, '1h'))
+                writer_rows[0] += 12
+                time.sleep(0.005)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        for day in range(10, 110, 10):
+            now = pd.Timestamp("2024-01-01") + pd.Timedelta(days=day)
+            retention.compact('prices', raw_days=7, archive_days=10_000, now=now)
+            if self.done.is_set():
+                break
+        writer.join()
+        time.sleep(0.2)
+        self.done.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(self.errors, [])
+        storage.sync_history(wait=True)
+        df = storage.load_tiered('prices')
+        self.assertEqual(len(df), writer_rows[0])
+        np.testing.assert_array_equal(df['Brent'].to_numpy(), np.arange(writer_rows[0]))
+
+    def test_rewrites_keep_rows_appended_by_another_process(self):
+        seen = threading.local()
+
+        def check():
+            seen.rows = self.check_prefix(getattr(seen, 'rows', 0), storage.load_tiered('prices'))
+
+        total = 24 * 150
+        storage.append_rows(storage.REALTIME_FILE, PRICE_FIELDS, self.rows(0, 24 * 20, '1h'))
+        readers = self.run_readers(check)
+        # Single-row appends as fast as possible, to hit the rename of a rewrite
+        writer = mp.get_context("spawn").Process(
+            target=_append_in_process, args=(os.getcwd(), 24 * 20, total, 1, '1h'))
+        writer.start()
+        rewrites = 0
+        while writer.is_alive() and not self.done.is_set():
+            # Both rewrites of the ingest CSV, racing the other process
+            storage.rebuild_history('prices')
+            if rewrites % 5 == 0:
+                now = pd.Timestamp("2024-01-01") + pd.Timedelta(days=10 + rewrites // 5)
+                retention.compact('prices', raw_days=7, archive_days=10_000, now=now)
+            rewrites += 1
+        writer.join()
+        time.sleep(0.2)
+        self.done.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(writer.exitcode, 0)
+        self.assertEqual(self.errors, [])
+        storage.sync_history(wait=True)
+        df = storage.load_tiered('prices')
+        self.assertEqual(len(df), total)
+        np.testing.assert_array_equal(df['Brent'].to_numpy(), np.arange(total))
+
+
+class ReplayTest(SimpleTestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("analytics")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def write_source(self, name, rows):
+        pd.DataFrame(rows).to_csv(name, index=False)
+        return name
+
+    def test_partitions_are_sorted_deduplicated_and_disjoint(self):
+        base = pd.Timestamp("2024-01-01")
+        rows = [
+            {'Date': str(base + pd.Timedelta(minutes=i % 30)), 'Asset': f'Pump-{i % 7}',
+             'Pressure': i, 'Temperature': i, 'Vibration': i, 'FlowRate': i, 'Efficiency': i}
+            for i in range(90)
+        ]
+        # Overlapping sources, the second in reverse order
+        sources = [self.write_source('a.csv', rows[:60]), self.write_source('b.csv', rows[30:][::-1])]
+
+        whole = replay.load_partition('sensors', sources)
+        self.assertEqual(len(whole), 90)
+        self.assertTrue(whole['Date'].is_monotonic_increasing)
+
+        parts = [replay.load_partition('sensors', sources, p, 3) for p in range(3)]
+        assets = [set(part['Asset']) for part in parts]
+        for i in range(3):
+            for j in range(i + 1, 3):
+                self.assertFalse(assets[i] & assets[j])
+        merged = pd.concat(parts).sort_values(['Date', 'Asset']).reset_index(drop=True)
+        pd.testing.assert_frame_equal(merged, whole)
+
+    def test_interrupted_partition_resumes_from_checkpoint(self):
+        source = self.write_source('prices.csv', _rows(0, 95, '1min'))
+        run_dir = replay.REPLAY_DIR / 'run'
+        run_dir.mkdir(parents=True)
+        job = ('prices', [source], 0, 1, str(run_dir), None, None, 0.0, 20)
+        sent = []
+        shared = {'lock': threading.Lock(), 'alerts': SimpleNamespace(put=sent.extend)}
+
+        batches = []
+
+        def interrupted(*args, **kwargs):
+            if len(batches) == 2:
+                raise RuntimeError('interrupted')
+            batches.append(args[1])
+            return ingest.ingest_batch(*args, **kwargs)
+
+        with mock.patch.dict(replay._shared, shared):
+            with mock.patch.object(replay, 'ingest_batch', side_effect=interrupted):
+                with self.assertRaises(RuntimeError):
+                    replay._replay_partition(job)
+            self.assertEqual(storage.read_json(run_dir / 'part-0.json')['rows'], 40)
+
+            result = replay._replay_partition(job)
+            self.assertEqual((result['resumed_at'], result['rows']), (40, 55))
+            # A finished partition is not replayed again
+            self.assertEqual(replay._replay_partition(job)['rows'], 0)
+
+        written = pd.read_csv(storage.REALTIME_FILE)
+        self.assertEqual(list(written['Brent']), list(range(95)))
+        # Replay workers leave the insights to the ingest process
+        self.assertFalse(insights.INSIGHTS_FILE.exists())
+
+    def test_replay_rebuilds_once_and_resumes_as_done(self):
+        # Recent enough to stay in the raw tier through the compaction
+        shift = pd.Timestamp.now().floor('D') - pd.Timestamp("2024-01-02")
+
+        def recent(start, count):
+            return [dict(row, Date=str(pd.Timestamp(row['Date']) + shift))
+                    for row in _rows(start, count, '1min')]
+
+        storage.append_rows(storage.REALTIME_FILE, PRICE_FIELDS, recent(50, 10))
+        source = self.write_source('prices.csv', recent(0, 60))
+
+        summary = replay.replay([source], workers=1, batch_rows=25)
+        self.assertEqual(summary['rows'], 60)
+        self.assertEqual(summary['duplicates_removed'], 10)
+        self.assertEqual(storage.history_generation('prices'), 1)
+        self.assertEqual(list(storage.load_history()['Brent']), list(range(60)))
+        self.assertFalse(insights.INSIGHTS_FILE.exists())
+
+        again = replay.replay([source], workers=1, batch_rows=25, rebuild=False)
+        self.assertEqual(again['run'], summary['run'])
+        self.assertEqual(again['rows'], 0)
+        self.assertEqual(again['partitions'][0]['resumed_at'], 60)
@@ -6,5 +6,9 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('api/dashboard-data/', views.api_dashboard_data, name='api_dashboard_data'),
     path('api/ai-insights/', views.api_ai_insights, name='api_ai_insights'),
+    path('api/maintenance/', views.api_maintenance, name='api_maintenance'),
+    path('api/alerts/', views.api_alerts, name='api_alerts'),
+    path('api/export/', views.api_export, name='api_export'),
+    path('api/indicators/', views.api_indicators, name='api_indicators'),
     path('generate-pdf-report/', views.generate_pdf_report, name='generate_pdf_report'),
 ]
\ No newline at end of file
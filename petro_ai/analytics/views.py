@@ -3,22 +3,28 @@ from django.shortcuts import render
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 import pandas as pd
-from pathlib import Path
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 import random
 import io
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib import colors
 
-REALTIME_FILE = Path("analytics/realtime_data.csv")
+from .storage import DATASETS, REALTIME_FILE, dataset_bounds, load_tiered
+from .reorder import parse_timestamp
+from .insights import load_insights
+from .anomaly import load_alerts
+from . import maintenance
+from . import export
+from . import indicators
 
 def generate_sample_data():
     """Generate sample data if file doesn't exist"""
@@ -36,46 +42,51 @@ def generate_sample_data():
     
     return df
 
+# Days covered by each time range option; anything else means full history
+TIME_RANGE_DAYS = {
+    'today': 1,
+    '7days': 7,
+    '30days': 30,
+    'quarter': 90,
+    'year': 365,
+}
+
+# Price column backing each single-commodity view
+ASSET_COLUMNS = {
+    'Brent Crude': 'Brent',
+    'WTI Crude': 'WTI',
+    'Natural Gas': 'NaturalGas',
+}
+
 def load_or_generate_data(time_range='30days', asset_filter='All Commodities'):
     """Load data with filters"""
     if not REALTIME_FILE.exists():
-        df = generate_sample_data()
-    else:
-        df = pd.read_csv(REALTIME_FILE)
-    
-    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-    df = df.dropna(subset=['Date'])
-    
-    # Apply time range filter
-    end_date = df['Date'].max()
-    if time_range == 'today':
-        start_date = end_date - pd.Timedelta(days=1)
-    elif time_range == '7days':
-        start_date = end_date - pd.Timedelta(days=7)
-    elif time_range == '30days':
-        start_date = end_date - pd.Timedelta(days=30)
-    elif time_range == 'quarter':
-        start_date = end_date - pd.Timedelta(days=90)
-    elif time_range == 'year':
-        start_date = end_date - pd.Timedelta(days=365)
-    else:
-        start_date = df['Date'].min()
-    
-    df = df[(df['Date'] >= start_date) & (df['Date'] <= end_date)]
-    
-    # Apply asset filter
-    if asset_filter != 'All Commodities':
-        if asset_filter == 'Brent Crude':
-            df = df[['Date', 'Brent']] if 'Brent' in df.columns else pd.DataFrame()
-        elif asset_filter == 'WTI Crude':
-            df = df[['Date', 'WTI']] if 'WTI' in df.columns else pd.DataFrame()
-        elif asset_filter == 'Natural Gas':
-            df = df[['Date', 'NaturalGas']] if 'NaturalGas' in df.columns else pd.DataFrame()
+        generate_sample_data()
+    
+    # Only read the columns the asset filter needs
+    columns = [ASSET_COLUMNS[asset_filter]] if asset_filter in ASSET_COLUMNS else None
+    
+    # Resolve the time window from the segment catalog and footer statistics,
+    # then read only the overlapping segments and row groups. Ticks that left
+    # the raw tier are charted from the hourly rollups.
+    start_date, end_date = dataset_bounds('prices', tier='rollup')
+    if end_date is None:
+        return pd.DataFrame()
+    if time_range in TIME_RANGE_DAYS:
+        start_date = end_date - pd.Timedelta(days=TIME_RANGE_DAYS[time_range])
+    
+    df = load_tiered('prices', columns, start=start_date, end=end_date, tier='rollup')
+    if columns is not None and columns[0] not in df.columns:
+        return pd.DataFrame()
     
     return df
 
-def create_line_chart(df, title="Real-Time Oil & Gas Prices"):
-    """Create line chart from data"""
+def create_line_chart(df, title="Real-Time Oil & Gas Prices", overlays=()):
+    """
+    Create line chart from data.
+    overlays: (indicator, label, values) from indicators.compute_indicators;
+    moving averages and bands share the price axis, oscillators get a panel each
+    """
     numeric_cols = [c for c in df.columns if c != 'Date']
     if not numeric_cols or df.empty:
         # Return empty chart placeholder
@@ -99,9 +110,17 @@ def create_line_chart(df, title="Real-Time Oil & Gas Prices"):
         )
         return fig.to_html(full_html=False, include_plotlyjs=False)
     
-    fig = go.Figure()
+    panels = []
+    for name, _, _ in overlays:
+        if name not in indicators.PRICE_OVERLAYS and name not in panels:
+            panels.append(name)
+    fig = make_subplots(
+        rows=1 + len(panels), cols=1, shared_xaxes=True, vertical_spacing=0.04,
+        row_heights=[0.6] + [0.4 / len(panels)] * len(panels) if panels else None
+    )
     
     colors = ['#00A8E8', '#FF6B35', '#2ECC71']
+    column_colors = {col: colors[idx % len(colors)] for idx, col in enumerate(numeric_cols)}
     for idx, col in enumerate(numeric_cols):
         fig.add_trace(go.Scatter(
             x=df['Date'],
@@ -110,7 +129,17 @@ def create_line_chart(df, title="Real-Time Oil & Gas Prices"):
             name=col,
             line=dict(width=2, color=colors[idx % len(colors)]),
             marker=dict(size=6, color=colors[idx % len(colors)])
-        ))
+        ), row=1, col=1)
+    
+    for name, label, values in overlays:
+        fig.add_trace(go.Scatter(
+            x=df['Date'],
+            y=values,
+            mode='lines',
+            name=label,
+            line=dict(width=1, color=column_colors.get(label.split(' ')[0], '#FFC107'),
+                      dash='dot' if name == 'bollinger' else 'dash')
+        ), row=1 if name in indicators.PRICE_OVERLAYS else 2 + panels.index(name), col=1)
     
     fig.update_layout(
         title=title,
@@ -119,16 +148,19 @@ def create_line_chart(df, title="Real-Time Oil & Gas Prices"):
         paper_bgcolor='rgba(0,0,0,0)',
         font_color='white',
         hovermode='x unified',
-        height=400,
+        height=400 + 150 * len(panels),
         xaxis=dict(
             gridcolor='rgba(100, 149, 237, 0.1)',
-            title="Date"
+            title="Date" if not panels else None
         ),
         yaxis=dict(
             gridcolor='rgba(100, 149, 237, 0.1)',
             title="Price ($)"
         )
     )
+    for row, name in enumerate(panels, start=2):
+        fig.update_yaxes(title_text=indicators.PANEL_TITLES[name], gridcolor='rgba(100, 149, 237, 0.1)', row=row, col=1)
+        fig.update_xaxes(gridcolor='rgba(100, 149, 237, 0.1)', title_text="Date" if row == len(panels) + 1 else None, row=row, col=1)
     
     return fig.to_html(full_html=False, include_plotlyjs=False)
 
@@ -219,42 +251,6 @@ def create_pie_chart(df):
     
     return fig.to_html(full_html=False, include_plotlyjs=False)
 
-def run_predictive_maintenance_demo():
-    """Generate realistic maintenance data"""
-    assets = ['Pump-{}'.format(i) for i in range(1, 11)]
-    metrics = ['Pressure', 'Temperature', 'Vibration', 'Flow Rate', 'Efficiency']
-    
-    maintenance_data = []
-    for i, asset in enumerate(assets):
-        metric = metrics[i % len(metrics)]
-        current_value = np.round(np.random.uniform(50, 100), 1)
-        failure_prob = np.round(np.random.uniform(0, 0.3), 2)
-        health_score = np.round(100 - (failure_prob * 100), 1)
-        
-        if failure_prob < 0.1:
-            status = 'Optimal'
-            status_class = 'success'
-        elif failure_prob < 0.2:
-            status = 'Warning'
-            status_class = 'warning'
-        else:
-            status = 'Critical'
-            status_class = 'danger'
-            
-        last_update = (datetime.now() - timedelta(hours=np.random.randint(0, 24))).strftime('%H:%M:%S')
-            
-        maintenance_data.append({
-            'Asset ID': asset,
-            'Metric': metric,
-            'Current Value': f'{current_value}',
-            'Predicted Failure': f'{failure_prob:.2f}',
-            'Health Score': f'{health_score}%',
-            'Status': f'<span class="badge bg-{status_class}">{status}</span>',
-            'Last Update': last_update
-        })
-    
-    return pd.DataFrame(maintenance_data)
-
 def calculate_summary(df):
     """Calculate summary statistics"""
     numeric_cols = [c for c in df.columns if c != 'Date']
@@ -359,15 +355,16 @@ def calculate_metrics(df):
     
     return metrics
 
-def get_dashboard_data(time_range='30days', asset_filter='All Commodities'):
+def get_dashboard_data(time_range='30days', asset_filter='All Commodities', indicator_specs=()):
     """Get all dashboard data with filters"""
     df = load_or_generate_data(time_range, asset_filter)
+    overlays = indicators.compute_indicators(df, indicator_specs)
     
     return {
-        'graph_line_html': create_line_chart(df),
+        'graph_line_html': create_line_chart(df, overlays=overlays),
         'graph_bar_html': create_bar_chart(df),
         'graph_pie_html': create_pie_chart(df),
-        'maintenance_df': run_predictive_maintenance_demo(),
+        'maintenance': maintenance.current_index(),
         'summary_html': calculate_summary(df),
         'metrics': calculate_metrics(df),
         'dataframe': df,
@@ -379,25 +376,32 @@ def home(request):
     """Main dashboard view"""
     time_range = request.GET.get('time_range', '30days')
     asset_filter = request.GET.get('asset_filter', 'All Commodities')
+    indicator_param = request.GET.get('indicators', '')
+    try:
+        indicator_specs = indicators.parse_indicators(indicator_param)
+    except ValueError:
+        indicator_param, indicator_specs = '', []
     
-    dashboard_data = get_dashboard_data(time_range, asset_filter)
+    dashboard_data = get_dashboard_data(time_range, asset_filter, indicator_specs)
     
-    # Convert maintenance DataFrame to HTML
-    maintenance_html = dashboard_data['maintenance_df'].to_html(
-        classes="table table-dark table-striped table-hover",
-        index=False,
-        escape=False
-    )
+    # First page of the maintenance table; further pages come from the API
+    index = dashboard_data['maintenance']
+    maintenance_rows, next_cursor = index.query()
     
     context = {
         "graph_line_html": dashboard_data['graph_line_html'],
         "graph_bar_html": dashboard_data['graph_bar_html'],
         "graph_pie_html": dashboard_data['graph_pie_html'],
-        "maintenance_html": maintenance_html,
+        "maintenance_columns": maintenance.COLUMNS,
+        "maintenance_rows": maintenance_rows,
+        "maintenance_next": next_cursor or '',
+        "maintenance_counts": json.dumps(index.counts),
+        "maintenance_version": index.version,
         "summary_html": dashboard_data['summary_html'],
         "initial_metrics": json.dumps(dashboard_data['metrics']),
         "current_time_range": time_range,
-        "current_asset_filter": asset_filter
+        "current_asset_filter": asset_filter,
+        "current_indicators": indicator_param
     }
     
     return render(request, "home.html", context)
@@ -408,75 +412,190 @@ def api_dashboard_data(request):
     if request.method == 'GET':
         time_range = request.GET.get('time_range', '30days')
         asset_filter = request.GET.get('asset_filter', 'All Commodities')
+        try:
+            indicator_specs = indicators.parse_indicators(request.GET.get('indicators'))
+        except ValueError as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
         
-        dashboard_data = get_dashboard_data(time_range, asset_filter)
-        
-        # Convert maintenance DataFrame to HTML
-        maintenance_html = dashboard_data['maintenance_df'].to_html(
-            classes="table table-dark table-striped table-hover",
-            index=False,
-            escape=False
-        )
+        dashboard_data = get_dashboard_data(time_range, asset_filter, indicator_specs)
         
         return JsonResponse({
             'graph_line_html': dashboard_data['graph_line_html'],
             'graph_bar_html': dashboard_data['graph_bar_html'],
             'graph_pie_html': dashboard_data['graph_pie_html'],
-            'maintenance_html': maintenance_html,
+            'maintenance_counts': dashboard_data['maintenance'].counts,
+            'maintenance_version': dashboard_data['maintenance'].version,
             'summary_html': dashboard_data['summary_html'],
             'metrics': dashboard_data['metrics'],
             'timestamp': datetime.now().isoformat(),
             'time_range': time_range,
             'asset_filter': asset_filter,
-            'data_sample': dashboard_data['dataframe'].tail(5).to_dict('records') if not dashboard_data['dataframe'].empty else []
+            'data_sample': dashboard_data['dataframe'].tail(5).to_dict('records') if not dashboard_data['dataframe'].empty else [],
+            'alerts': load_alerts()['alerts'][:10]
         })
 
-def api_ai_insights(request):
-    """API endpoint for AI insights"""
-    insights = [
-        {
-            "title": "Market Analysis",
-            "content": "Brent crude showing resilience above $84 support. AI predicts 2-3% upside in next 7 days based on inventory data and geopolitical factors.",
-            "icon": "chart-line",
-            "priority": "high",
-            "color": "#00A8E8"
-        },
-        {
-            "title": "Operational Efficiency",
-            "content": "Refinery Alpha shows 8% higher energy consumption than benchmark. Optimizing distillation unit #3 could save $42K monthly in energy costs.",
-            "icon": "cogs",
-            "priority": "medium",
-            "color": "#FF6B35"
-        },
-        {
-            "title": "Predictive Maintenance",
-            "content": "Pump #342 at Refinery Delta showing 12% efficiency drop. Schedule maintenance within 48 hours to prevent potential failure costing $150K in downtime.",
-            "icon": "tools",
-            "priority": "critical",
-            "color": "#E74C3C"
-        },
-        {
-            "title": "Production Optimization",
-            "content": "Adjusting drilling parameters at Well #42 could increase output by 4%. AI recommends testing new configuration during low-demand periods.",
-            "icon": "oil-can",
-            "priority": "medium",
-            "color": "#2ECC71"
-        },
-        {
-            "title": "Inventory Management",
-            "content": "Natural gas inventories 15% below seasonal average. Consider increasing storage purchases during current price dip.",
-            "icon": "warehouse",
-            "priority": "high",
-            "color": "#9C27B0"
+def api_maintenance(request):
+    """
+    Paginated maintenance table.
+    Query parameters: sort, order (asc/desc), status, asset, min_health,
+    max_health, limit and cursor (from the previous page's next_cursor)
+    """
+    sort = request.GET.get('sort', 'health_score')
+    order = request.GET.get('order', 'asc')
+    status = request.GET.get('status') or None
+    if sort not in maintenance.SORT_FIELDS:
+        return JsonResponse({'error': f'unknown sort field: {sort}'}, status=400)
+    if order not in ('asc', 'desc'):
+        return JsonResponse({'error': f'unknown order: {order}'}, status=400)
+    if status is not None and status not in maintenance.STATUSES:
+        return JsonResponse({'error': f'unknown status: {status}'}, status=400)
+    try:
+        limit = min(int(request.GET.get('limit', maintenance.DEFAULT_PAGE_SIZE)), maintenance.MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    bounds = {}
+    for name in ('min_health', 'max_health'):
+        try:
+            bounds[name] = float(request.GET[name]) if request.GET.get(name) else None
+        except ValueError:
+            return JsonResponse({'error': f'{name} must be a number'}, status=400)
+    try:
+        cursor = maintenance.decode_cursor(request.GET['cursor'], sort, order) if request.GET.get('cursor') else None
+    except ValueError as exc:
+        # decode_cursor only raises its own fixed messages
+        return JsonResponse({'error': str(exc)}, status=400)
+    
+    index = maintenance.current_index()
+    rows, next_cursor = index.query(
+        sort=sort, order=order, status=status, asset=request.GET.get('asset'),
+        min_health=bounds['min_health'], max_health=bounds['max_health'], cursor=cursor,
+        limit=max(limit, 1)
+    )
+    
+    return JsonResponse({
+        'rows': rows,
+        'next_cursor': next_cursor,
+        'counts': index.counts,
+        'total': len(index.records),
+        'version': index.version,
+        # Rows may have moved since the previous page was served
+        'snapshot_changed': cursor is not None and cursor['version'] != index.version
+    })
+
+def api_indicators(request):
+    """
+    Technical indicator series for the charted prices.
+    Query parameters: time_range, asset_filter and indicators, a comma
+    separated list of name[:window] with names sma, ema, bollinger, rsi, atr
+    and corr (e.g. sma:20,ema:50,rsi)
+    """
+    time_range = request.GET.get('time_range', '30days')
+    asset_filter = request.GET.get('asset_filter', 'All Commodities')
+    try:
+        indicator_specs = indicators.parse_indicators(request.GET.get('indicators', 'sma,ema'))
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    
+    df = load_or_generate_data(time_range, asset_filter)
+    series = {}
+    for name, label, values in indicators.compute_indicators(df, indicator_specs):
+        series[label] = {
+            'indicator': name,
+            'values': [None if np.isnan(v) else round(float(v), 4) for v in values],
         }
-    ]
     
     return JsonResponse({
-        'insights': insights,
-        'generated_at': datetime.now().isoformat(),
-        'total_insights': len(insights)
+        'dates': df['Date'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist() if not df.empty else [],
+        'series': series,
+        'time_range': time_range,
+        'asset_filter': asset_filter
+    })
+
+def api_export(request):
+    """
+    Stream historical data as CSV, NDJSON or Parquet.
+    Query parameters:
+      dataset     prices (default) or sensors
+      format      csv (default), ndjson or parquet
+      start, end  inclusive time bounds
+      columns     comma separated column names
+      resolution  pandas frequency such as 1min, 1h or 1D for bucket means
+      compress    gzip for CSV/NDJSON; zstd, snappy or gzip for Parquet
+      offset      rows already received, to resume an interrupted export
+    """
+    dataset = request.GET.get('dataset', 'prices')
+    fmt = request.GET.get('format', 'csv')
+    compression = request.GET.get('compress') or None
+    if dataset not in DATASETS:
+        return JsonResponse({'error': f'unknown dataset: {dataset}'}, status=400)
+    if fmt not in export.FORMATS:
+        return JsonResponse({'error': f'unknown format: {fmt}'}, status=400)
+    # Checked before streaming starts: a codec error mid-stream would only
+    # truncate the download
+    if compression and compression not in export.COMPRESSIONS[fmt]:
+        return JsonResponse({'error': f'unsupported compression: {compression}'}, status=400)
+    # History dates are naive local time; offset-aware bounds are converted
+    # here, since comparing them inside the stream would fail after the
+    # response headers are sent
+    bounds = {}
+    for name in ('start', 'end'):
+        value = request.GET.get(name)
+        bounds[name] = parse_timestamp(value) if value else None
+        if value and bounds[name] is None:
+            return JsonResponse({'error': f'{name} must be a date'}, status=400)
+    start, end = bounds['start'], bounds['end']
+    resolution = request.GET.get('resolution') or None
+    try:
+        if resolution:
+            pd.tseries.frequencies.to_offset(resolution)
+    except ValueError:
+        return JsonResponse({'error': 'resolution must be a pandas frequency such as 1h'}, status=400)
+    try:
+        offset = int(request.GET.get('offset', 0))
+    except ValueError:
+        return JsonResponse({'error': 'offset must be an integer'}, status=400)
+    columns = request.GET.get('columns')
+    columns = [c.strip() for c in columns.split(',') if c.strip()] if columns else None
+    
+    frames = export.iter_frames(dataset, columns, start, end, resolution, max(offset, 0))
+    response = StreamingHttpResponse(
+        export.stream_export(frames, fmt, compression, export.empty_schema(dataset, columns)),
+        content_type=export.FORMATS[fmt][0]
+    )
+    if compression == 'gzip' and fmt != 'parquet':
+        response['Content-Type'] = 'application/gzip'
+    response['Content-Disposition'] = f'attachment; filename="{export.export_filename(dataset, fmt, compression)}"'
+    response['X-Export-Offset'] = str(max(offset, 0))
+    return response
+
+# Alerts returned by the alerts API by default and at most
+ALERTS_PAGE_SIZE = 50
+MAX_ALERTS_PAGE_SIZE = 500
+
+def api_alerts(request):
+    """API endpoint for streaming anomaly alerts"""
+    try:
+        limit = min(max(int(request.GET.get('limit', ALERTS_PAGE_SIZE)), 1), MAX_ALERTS_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    data = load_alerts()
+    return JsonResponse({
+        'alerts': data['alerts'][:limit],
+        'asset_scores': data['asset_scores'],
+        'updated_at': data.get('updated_at')
     })
 
+def get_insights():
+    """Latest published market insights and maintenance risk ranking"""
+    return load_insights()
+
+def api_ai_insights(request):
+    """API endpoint for AI insights"""
+    return JsonResponse(get_insights())
+
+# Maintenance rows listed in the PDF report
+PDF_MAINTENANCE_ROWS = 50
+
 def generate_pdf_report(request):
     """Generate PDF report"""
     # Create a file-like buffer to receive PDF data.
@@ -544,21 +663,12 @@ def generate_pdf_report(request):
     # Add maintenance section
     elements.append(Paragraph("<br/><br/>Predictive Maintenance Status", styles['Heading2']))
     
-    maintenance_df = dashboard_data['maintenance_df']
-    maintenance_data = [list(maintenance_df.columns)]
-    for _, row in maintenance_df.iterrows():
-        # Remove HTML tags from status
-        status = str(row['Status']).replace('<span class="badge bg-', '').replace('</span>', '')
-        status = status.split('>')[-1] if '>' in status else status
-        maintenance_data.append([
-            row['Asset ID'],
-            row['Metric'],
-            row['Current Value'],
-            row['Predicted Failure'],
-            row['Health Score'],
-            status,
-            row['Last Update']
-        ])
+    # Most at-risk assets first
+    index = dashboard_data['maintenance']
+    maintenance_data = [[label for _, label in maintenance.COLUMNS]]
+    at_risk, _ = index.query(sort='predicted_failure', order='desc', limit=PDF_MAINTENANCE_ROWS)
+    for rec in at_risk:
+        maintenance_data.append([rec[field] for field, _ in maintenance.COLUMNS])
     
     if len(maintenance_data) > 1:
         maint_table = Table(maintenance_data)
@@ -576,16 +686,9 @@ def generate_pdf_report(request):
     
     # Add recommendations
     elements.append(Paragraph("<br/><br/>AI Recommendations", styles['Heading2']))
-    recommendations = [
-        "1. Increase Brent crude production allocation by 5%",
-        "2. Schedule maintenance for Pump #342 within 48 hours",
-        "3. Optimize distillation unit #3 for energy efficiency",
-        "4. Review hedging strategy for natural gas positions",
-        "5. Implement AI recommendations for Well #42 optimization"
-    ]
-    
-    for rec in recommendations:
-        elements.append(Paragraph(rec, styles['Normal']))
+    insights = get_insights()['insights'][:5]
+    for idx, insight in enumerate(insights, start=1):
+        elements.append(Paragraph(f"{idx}. {insight['recommendation']}", styles['Normal']))
     
     # Build PDF
     doc.build(elements)